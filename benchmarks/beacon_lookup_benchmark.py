@@ -0,0 +1,91 @@
+"""Microbenchmark of the per-scan cost of matching a scan to a beacon.
+
+Compares the beacon-advance loop that `Simulation.run` used to walk beacons
+one at a time with the closed-form `find_beacon` lookup and with
+`advance_beacon`, which `Simulation.run` now uses, over a grid of
+(L, omega, rate). The lookup costs should stay flat as the number of beacons
+per scan grows, and `advance_beacon` should be no slower than the loop where
+the loop rarely advances.
+
+Run from the repository root:
+
+    python -m benchmarks.beacon_lookup_benchmark
+"""
+import itertools
+import time
+
+import numpy as np
+
+from lib.ble_simulation import advance_beacon, find_beacon
+
+L_VALUES = [1.0, 10.0, 100.0]
+OMEGA_VALUES = [1.0, 0.1, 0.01]
+RATE_VALUES = [1.0, 0.1, 0.01]
+NUM_SCANS = 20000
+
+
+def beacon_advance_loop(y_k, beacon_period, beacon_duration, n_i):
+    """The beacon-advance loop `Simulation.run` used before `find_beacon`."""
+    a = n_i * beacon_period - beacon_duration / 2
+    b = n_i * beacon_period + beacon_duration / 2
+    while y_k > b:
+        n_i += 1
+        a = n_i * beacon_period - beacon_duration / 2
+        b = n_i * beacon_period + beacon_duration / 2
+    return n_i, a <= y_k <= b
+
+
+def time_per_scan(scan_times, L, omega):
+    """Return the per-scan cost in microseconds of the loop, `find_beacon` and `advance_beacon`."""
+    start = time.perf_counter()
+    n_i = 1
+    for y_k in scan_times:
+        n_i, _ = beacon_advance_loop(y_k, L, omega, n_i)
+    loop_cost = (time.perf_counter() - start) / len(scan_times) * 1e6
+
+    start = time.perf_counter()
+    for y_k in scan_times:
+        find_beacon(y_k, L, omega)
+    lookup_cost = (time.perf_counter() - start) / len(scan_times) * 1e6
+
+    start = time.perf_counter()
+    n_i = 1
+    for y_k in scan_times:
+        n_i, _ = advance_beacon(y_k, L, omega, n_i)
+    advance_cost = (time.perf_counter() - start) / len(scan_times) * 1e6
+
+    return loop_cost, lookup_cost, advance_cost
+
+
+def run_benchmark(num_scans=NUM_SCANS, seed=0):
+    """Benchmark the lookups over the (L, omega, rate) grid.
+
+    Returns:
+        List of dicts with the grid point and per-scan costs in microseconds.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for L, omega, rate in itertools.product(L_VALUES, OMEGA_VALUES, RATE_VALUES):
+        if omega >= L:
+            continue
+        scan_times = np.cumsum(rng.exponential(scale=1 / rate, size=num_scans)).tolist()
+        loop_cost, lookup_cost, advance_cost = time_per_scan(scan_times, L, omega)
+        results.append({
+            "L": L,
+            "omega": omega,
+            "rate": rate,
+            "beacons_per_scan": 1 / (rate * L),
+            "loop_us_per_scan": loop_cost,
+            "lookup_us_per_scan": lookup_cost,
+            "advance_us_per_scan": advance_cost,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'L':>6} {'omega':>6} {'rate':>6} {'beacons/scan':>13} {'loop us':>9} {'lookup us':>10} "
+          f"{'advance us':>11}")
+    for row in run_benchmark():
+        print(f"{row['L']:>6} {row['omega']:>6} {row['rate']:>6} {row['beacons_per_scan']:>13.3f} "
+              f"{row['loop_us_per_scan']:>9.3f} {row['lookup_us_per_scan']:>10.3f} "
+              f"{row['advance_us_per_scan']:>11.3f}")
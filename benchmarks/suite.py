@@ -0,0 +1,349 @@
+"""Benchmark suite of the simulation, analytical model and environment hot paths.
+
+Every benchmark is a fixed-seed workload over representative (L, omega, rate)
+points, including the low-rate and tiny-omega corners where the simulations
+need the most scans and the analytical model the most beacons. For each one
+the suite reports the per-call time (median of repeated calls), the
+throughput in trials, points or steps per second and the peak memory traced
+by `tracemalloc` during one call.
+
+Results can be saved as a JSON baseline and later runs compared against it;
+benchmarks slower than the baseline by more than the threshold are flagged
+and make the run exit with status 1. `benchmarks/baseline.json` is the
+baseline of the current code; its "meta" entry records the machine it was
+measured on. Timings only compare on the same machine, so elsewhere save a
+baseline of the unchanged tree first and compare the changed tree against it.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --compare benchmarks/baseline.json --threshold 1.25
+    python -m benchmarks.suite --save /tmp/baseline.json
+    python -m benchmarks.suite --compare /tmp/baseline.json
+    python -m benchmarks.suite --filter analytical
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.beacon_lookup_benchmark import beacon_advance_loop
+
+# (L, omega, rate) workloads: a typical point, the cheap corner of the RL
+# action space, the low-rate corner, a tiny beacon and both at once
+POINTS = {
+    "typical": (2.0, 0.5, 0.5),
+    "fast": (1.0, 1.9, 1.0),
+    "low_rate": (10.0, 0.1, 0.1),
+    "tiny_omega": (10.0, 0.01, 0.5),
+    "low_rate_tiny_omega": (10.0, 0.01, 0.1),
+}
+
+# (scan interval, advertising interval, advertising window) workloads of the
+# periodic-scan baseline. Its scan window is open in [0, 0.15), so advertising
+# intervals below 0.15 s are discovered at the first event and measure
+# nothing. A typical point, the longest scan interval with a tiny advertising
+# window (about 100 events per trial) and the lowest advertising rate.
+OTHER_METHOD_POINTS = {
+    "typical": (2.56, 1.0, 0.002),
+    "long_scan_interval": (10.24, 0.2, 0.001),
+    "low_adv_rate": (1.5, 10.24, 0.01),
+}
+
+SEED = 0
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    """Register a benchmark setup function under `name`.
+
+    The setup function takes the seed and returns a callable running one
+    call of the workload and the number of `unit`s one call processes.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+    return register
+
+
+def _register_point_benchmarks():
+    from lib.ble_simulation import BatchSimulation, Simulation, advance_beacon, find_beacon
+    from lib.math import ErlangTableCache, adaptive_latency_result, analytical_latency_result
+
+    for label, (L, omega, rate) in POINTS.items():
+        def simulation_run(seed, L=L, omega=omega, rate=rate, num_trials=200):
+            simulation = Simulation(rate, omega, L)
+            beacon_histogram = np.zeros(10**6)
+
+            def run():
+                np.random.seed(seed)
+                for _ in range(num_trials):
+                    simulation.run(beacon_histogram)
+            return run, num_trials
+
+        def batch_simulation_run(seed, L=L, omega=omega, rate=rate, num_trials=10000):
+            simulation = BatchSimulation(rate, omega, L)
+            return lambda: simulation.run(num_trials, rng=np.random.default_rng(seed)), num_trials
+
+        def analytical_latency(seed, L=L, omega=omega, rate=rate):
+            return lambda: analytical_latency_result((L, omega, rate), 100, 100), 1
+
+        def cached_analytical_latency(seed, L=L, omega=omega, rate=rate):
+            cache = ErlangTableCache()
+            return lambda: analytical_latency_result((L, omega, rate), 100, 100, cache=cache), 1
+
+        def adaptive_latency(seed, L=L, omega=omega, rate=rate):
+            return lambda: adaptive_latency_result((L, omega, rate), tol=1e-6), 1
+
+        def beacon_lookup(seed, L=L, omega=omega, rate=rate, num_scans=20000):
+            scan_times = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, num_scans)).tolist()
+
+            def run():
+                for y_k in scan_times:
+                    find_beacon(y_k, L, omega)
+            return run, num_scans
+
+        def beacon_advance(seed, L=L, omega=omega, rate=rate, num_scans=20000):
+            scan_times = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, num_scans)).tolist()
+
+            def run():
+                n_i = 1
+                for y_k in scan_times:
+                    n_i, _ = beacon_advance_loop(y_k, L, omega, n_i)
+            return run, num_scans
+
+        def beacon_jump(seed, L=L, omega=omega, rate=rate, num_scans=20000):
+            scan_times = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, num_scans)).tolist()
+
+            def run():
+                n_i = 1
+                for y_k in scan_times:
+                    n_i, _ = advance_beacon(y_k, L, omega, n_i)
+            return run, num_scans
+
+        benchmark(f"simulation_run[{label}]", "trials")(simulation_run)
+        benchmark(f"batch_simulation_run[{label}]", "trials")(batch_simulation_run)
+        benchmark(f"analytical_latency[{label}]", "points")(analytical_latency)
+        benchmark(f"cached_analytical_latency[{label}]", "points")(cached_analytical_latency)
+        benchmark(f"adaptive_latency[{label}]", "points")(adaptive_latency)
+        benchmark(f"beacon_lookup[{label}]", "scans")(beacon_lookup)
+        benchmark(f"beacon_advance_loop[{label}]", "scans")(beacon_advance)
+        benchmark(f"advance_beacon[{label}]", "scans")(beacon_jump)
+
+
+_register_point_benchmarks()
+
+
+@benchmark("analytical_latency_batch", "points")
+def analytical_latency_batch(seed, num_points=1024):
+    from lib.math import analytical_latency_result
+
+    rng = np.random.default_rng(seed)
+    params = (rng.uniform(1.0, 10.0, num_points), rng.uniform(0.1, 1.9, num_points),
+              rng.uniform(0.1, 1.0, num_points))
+    return lambda: analytical_latency_result(params, 100, 100), num_points
+
+
+def _register_other_method_benchmarks():
+    for label, params in OTHER_METHOD_POINTS.items():
+        def other_method_run(seed, params=params, num_trials=200):
+            import random
+            from lib.ble_other_method_simulation import BLEOtherMethodSimulation
+
+            simulation = BLEOtherMethodSimulation(*params)
+
+            def run():
+                random.seed(seed)
+                for _ in range(num_trials):
+                    simulation.run()
+            return run, num_trials
+
+        def batch_other_method_run(seed, params=params, num_trials=10000):
+            from lib.ble_other_method_simulation import BatchBLEOtherMethodSimulation
+
+            simulation = BatchBLEOtherMethodSimulation(*params)
+            return lambda: simulation.run(num_trials, rng=np.random.default_rng(seed)), num_trials
+
+        benchmark(f"other_method_run[{label}]", "trials")(other_method_run)
+        benchmark(f"batch_other_method_run[{label}]", "trials")(batch_other_method_run)
+
+
+_register_other_method_benchmarks()
+
+
+@benchmark("recommended_quorum_size", "calls")
+def recommended_quorum_size(seed, num_calls=1000):
+    from lib.fuzzy_logic import get_recommended_quorum_size
+
+    battery_levels = np.random.default_rng(seed).integers(0, 101, num_calls).tolist()
+    get_recommended_quorum_size(50, 5, 0)
+
+    def run():
+        for battery_level in battery_levels:
+            get_recommended_quorum_size(battery_level, 5, 0)
+    return run, num_calls
+
+
+def _env_steps(computation_method, num_steps):
+    def setup(seed):
+        from lib.bluetooth_discovery_env import BluetoothDiscoveryEnv
+
+        rng = np.random.default_rng(seed)
+        env = BluetoothDiscoveryEnv(computation_method)
+        actions = env.action_space.low + rng.random((num_steps, 3)) * (env.action_space.high - env.action_space.low)
+
+        def run():
+            # A fresh cache per call, so every step computes its action
+            env.oracle.clear()
+            np.random.seed(seed)
+            env.reset()
+            for action in actions:
+                env.step(action)
+        return run, num_steps
+    return setup
+
+
+def _register_env_benchmarks():
+    from lib.bluetooth_discovery_env import ComputationMethod
+
+    benchmark("env_step[analytical]", "steps")(_env_steps(ComputationMethod.ANALYTICAL, 200))
+    benchmark("env_step[simulation]", "steps")(_env_steps(ComputationMethod.SIMULATION, 5))
+
+
+try:
+    _register_env_benchmarks()
+except ImportError:
+    # The environment needs gymnasium
+    pass
+
+
+def measure(setup, seed=SEED, min_time=0.5, max_repeats=50, min_repeats=3):
+    """
+    Time one benchmark.
+
+    The workload is run once to warm up, then repeatedly until `min_time`
+    seconds have passed (at least `min_repeats` and at most `max_repeats`
+    calls), and once more under `tracemalloc` for the peak memory.
+
+    Returns:
+        Dict with the median and minimum per-call time in seconds, the number
+        of timed calls, the units per call and the peak traced memory in bytes.
+    """
+    run, units = setup(seed)
+    run()
+
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_repeats or (time.perf_counter() - start < min_time and len(times) < max_repeats):
+        call_start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - call_start)
+
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "per_call_s": statistics.median(times),
+        "min_per_call_s": min(times),
+        "repeats": len(times),
+        "units_per_call": units,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run_suite(names=None, seed=SEED, min_time=0.5, verbose=False):
+    """
+    Run the benchmarks in `names`, all registered ones by default.
+
+    Returns:
+        Dict with the environment under "meta" and one `measure` result per
+        benchmark, with its throughput and unit, under "results".
+    """
+    results = {}
+    for name in names if names is not None else BENCHMARKS:
+        setup, unit = BENCHMARKS[name]
+        result = measure(setup, seed=seed, min_time=min_time)
+        result["unit"] = unit
+        result["throughput"] = result["units_per_call"] / result["per_call_s"]
+        results[name] = result
+        if verbose:
+            print(format_row(name, result), flush=True)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=1.25):
+    """
+    Compare per-call times against a baseline.
+
+    The fastest call of each benchmark is compared, which is less sensitive
+    to interference from other processes than the median.
+
+    Returns:
+        Dict of benchmark name to the ratio of the current to the baseline
+        per-call time, for the benchmarks slower than `threshold` times the
+        baseline.
+    """
+    regressions = {}
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        ratio = result["min_per_call_s"] / baseline["results"][name]["min_per_call_s"]
+        if ratio > threshold:
+            regressions[name] = ratio
+    return regressions
+
+
+def format_row(name, result):
+    per_unit_us = result["per_call_s"] / result["units_per_call"] * 1e6
+    return (f"{name:<48} {result['per_call_s'] * 1e3:>11.3f} {per_unit_us:>11.3f} "
+            f"{result['throughput']:>13.1f} {result['unit']:<7} {result['peak_memory_bytes'] / 2**20:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Flag benchmarks slower than this ratio of the baseline')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds spent timing each benchmark')
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    print(f"{'benchmark':<48} {'ms/call':>11} {'us/unit':>11} {'throughput':>13} {'unit':<7} {'peak MiB':>9}")
+    results = run_suite(names, seed=args.seed, min_time=args.min_time, verbose=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for name, ratio in regressions.items():
+            print(f'REGRESSION {name}: {ratio:.2f}x the baseline time')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.2f}x the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,23 +2,39 @@ import os
 from stable_baselines3 import PPO
 
 from lib.bluetooth_discovery_env import BluetoothDiscoveryEnv, ComputationMethod
+from lib.instrumentation_callback import InstrumentationCallback
 
 model_dir = 'models/PPO'
 logdir = "logs/PPO"
+cache_dir = "cache"
+# Record the hot-path timers and counters of lib/instrumentation.py to TensorBoard
+instrument = False
 
 if not os.path.exists(model_dir):
     os.makedirs(model_dir)
     
 if not os.path.exists(logdir):
     os.makedirs(logdir)
+
+# The latency cache is shared by all the experiment scripts, the seeded
+# simulation results are reproducible and can be reused across runs
+if not os.path.exists(cache_dir):
+    os.makedirs(cache_dir)
     
-env = BluetoothDiscoveryEnv(computation_method=ComputationMethod.SIMULATION)
+env = BluetoothDiscoveryEnv(computation_method=ComputationMethod.SIMULATION,
+                            cache_quantum=1e-3,
+                            simulation_seed=0,
+                            cache_path=f"{cache_dir}/latency_oracle")
 env.reset()
 
 model  = PPO("MultiInputPolicy", env, verbose=1, tensorboard_log=logdir)
+callback = InstrumentationCallback() if instrument else None
 
 TIMESTEPS = 1000
 
 for i in range(30):
-    model.learn(total_timesteps=TIMESTEPS, reset_num_timesteps=False, tb_log_name="PPO", progress_bar=True)
-    model.save(f"{model_dir}/{TIMESTEPS*i}")
\ No newline at end of file
+    model.learn(total_timesteps=TIMESTEPS, reset_num_timesteps=False, tb_log_name="PPO", progress_bar=True,
+                callback=callback)
+    model.save(f"{model_dir}/{TIMESTEPS*i}")
+
+env.close()
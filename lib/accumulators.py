@@ -0,0 +1,217 @@
+"""Mergeable accumulators for simulation results."""
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Running count, mean and variance of a stream of values (Welford's method).
+
+    Batches are folded in with the parallel update of Chan et al., so two
+    accumulators filled independently can also be merged.
+    """
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        """Add a batch of values."""
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        mean = np.mean(values)
+        self._combine(values.size, mean, np.sum((values - mean)**2))
+
+    def merge(self, other):
+        """Add all values seen by another `RunningMoments`."""
+        self._combine(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def variance(self):
+        """The population variance, as `np.var`."""
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def ci_half_width(self, z_value=1.96):
+        """Half-width of the normal confidence interval of the mean."""
+        return z_value * self.std / np.sqrt(self.count) if self.count else np.inf
+
+
+class BincountCounter:
+    """
+    Counts of non-negative integers, as `np.bincount`, in an array that grows
+    to the largest value seen.
+    """
+    def __init__(self) -> None:
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def _add(self, counts):
+        if len(counts) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counts)] += counts
+
+    def update(self, values):
+        """Count a batch of values."""
+        values = np.asarray(values, dtype=np.int64).ravel()
+        if values.size > 0:
+            self._add(np.bincount(values))
+
+    def merge(self, other):
+        """Add all values counted by another `BincountCounter`."""
+        self._add(other.counts)
+        return self
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+
+class LatencyHistogram:
+    """
+    A log-linear (HDR-style) histogram of positive values.
+
+    Every power of two is split into 2**significant_bits bins of equal width,
+    so a bin is at most 2**-significant_bits of its values wide and quantiles
+    and the CDF are known to that relative precision over any range of values,
+    at a few kilobytes per histogram. Values below `min_value`, including
+    zero, are counted in the first bin. Histograms of the same precision merge
+    by adding their counts.
+    """
+    def __init__(self, significant_bits=7, min_value=2.0**-20) -> None:
+        self.significant_bits = significant_bits
+        self.sub_bins = 2**significant_bits
+        self.min_exponent = int(np.frexp(min_value)[1])
+        self.bins = BincountCounter()
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _index(self, values):
+        mantissa, exponent = np.frexp(values)
+        index = (exponent - self.min_exponent) * self.sub_bins + \
+            ((2 * mantissa - 1) * self.sub_bins).astype(np.int64)
+        return np.where(values >= np.ldexp(0.5, self.min_exponent), index, 0)
+
+    def bin_edges(self):
+        """The len(counts) + 1 edges of the bins, the first bin starts at 0."""
+        index = np.arange(len(self.bins.counts) + 1)
+        exponent = index // self.sub_bins + self.min_exponent
+        edges = np.ldexp(1 + (index % self.sub_bins) / self.sub_bins, exponent - 1)
+        edges[0] = 0.0
+        return edges
+
+    @property
+    def counts(self):
+        return self.bins.counts
+
+    def update(self, values):
+        """Add a batch of values."""
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        self.bins.update(self._index(values))
+        self.count += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def merge(self, other):
+        """Add all values seen by another `LatencyHistogram` of the same precision."""
+        if (other.sub_bins, other.min_exponent) != (self.sub_bins, self.min_exponent):
+            raise ValueError('Only histograms with the same bins can be merged')
+        self.bins.merge(other.bins)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate quantiles by interpolating linearly within their bin.
+
+        Args:
+            q (float or array): Probabilities in [0, 1]
+
+        Returns:
+            The quantiles, clipped to the smallest and largest value seen,
+            nan when the histogram is empty.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        counts = self.counts
+        cumulative = np.cumsum(counts)
+        edges = self.bin_edges()
+
+        rank = q * self.count
+        index = np.minimum(np.searchsorted(cumulative, rank, side='left'), len(counts) - 1)
+        before = cumulative[index] - counts[index]
+        fraction = np.where(counts[index] > 0, (rank - before) / np.maximum(counts[index], 1), 0)
+        value = edges[index] + fraction * (edges[index + 1] - edges[index])
+        return np.clip(value, self.min, self.max)[()]
+
+    def cdf(self, x):
+        """
+        Estimate the fraction of values at most `x`, assuming the values of a
+        bin are spread uniformly over it.
+        """
+        x = np.asarray(x, dtype=float)
+        if self.count == 0:
+            return np.full(x.shape, np.nan)[()]
+        counts = self.counts
+        cumulative = np.cumsum(counts)
+        edges = self.bin_edges()
+
+        index = np.minimum(self._index(x), len(counts) - 1)
+        before = cumulative[index] - counts[index]
+        fraction = np.clip((x - edges[index]) / (edges[index + 1] - edges[index]), 0, 1)
+        probability = (before + counts[index] * fraction) / self.count
+        return np.where(x < self.min, 0.0, np.where(x >= self.max, 1.0, probability))[()]
+
+
+class DiscoveryAccumulator:
+    """
+    A compact, mergeable summary of discovery trials.
+
+    Keeps the running moments of the latency and energy cost, a
+    `LatencyHistogram` of the latency and the counts of the discovering
+    beacon, whose entry i counts the discoveries at beacon i + 1, instead of
+    the per-trial values. Accumulators filled by parallel workers can be
+    merged.
+    """
+    def __init__(self, significant_bits=7) -> None:
+        self.latency = RunningMoments()
+        self.energy_cost = RunningMoments()
+        self.latency_histogram = LatencyHistogram(significant_bits)
+        self.beacon_histogram = BincountCounter()
+
+    @property
+    def count(self):
+        return self.latency.count
+
+    def update(self, latencies, energy_costs, beacon_indices):
+        """Add a batch of trials, with beacon indices starting at 1."""
+        self.latency.update(latencies)
+        self.energy_cost.update(energy_costs)
+        self.latency_histogram.update(latencies)
+        self.beacon_histogram.update(np.asarray(beacon_indices) - 1)
+
+    def merge(self, other):
+        """Add all trials seen by another `DiscoveryAccumulator`."""
+        self.latency.merge(other.latency)
+        self.energy_cost.merge(other.energy_cost)
+        self.latency_histogram.merge(other.latency_histogram)
+        self.beacon_histogram.merge(other.beacon_histogram)
+        return self
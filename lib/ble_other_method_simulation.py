@@ -1,8 +1,44 @@
 import random
 import numpy as np
 
+from lib.ble_simulation import calculate_ci
+from lib.ble_simulation import num_simulations as num_batch_simulations
+
 num_simulations = 10
 
+
+def first_scan_overlap(adv_start, adv_end, scanning_interval, scan_window):
+    """
+    Find the first time the scanner is active during an advertising event.
+
+    The scanner is active in the windows [mT, mT + Ts) for m = 0, 1, ... so
+    the advertising event [adv_start, adv_end] is either discovered at its
+    start, if that falls inside a scan window, or at the opening of the next
+    scan window, if that happens before the event ends.
+
+    Parameters:
+    adv_start (float or array): The start time of the advertising event.
+    adv_end (float or array): The end time of the advertising event.
+    scanning_interval (float): The scan interval T.
+    scan_window (float): The scan window Ts.
+
+    Returns:
+    float or array: The discovery time, or nan if the event is missed.
+    """
+    if isinstance(adv_start, float):
+        # Plain float arithmetic, avoiding NumPy's per-call scalar overhead
+        scan_window_start = (adv_start // scanning_interval) * scanning_interval
+        next_scan_window_start = scan_window_start + scanning_interval
+        if adv_start - scan_window_start < scan_window:
+            return adv_start
+        return next_scan_window_start if next_scan_window_start <= adv_end else np.nan
+
+    scan_window_start = np.floor(adv_start / scanning_interval) * scanning_interval
+    next_scan_window_start = scan_window_start + scanning_interval
+    discovery_time = np.where(adv_start - scan_window_start < scan_window, adv_start,
+                              np.where(next_scan_window_start <= adv_end, next_scan_window_start, np.nan))
+    return discovery_time[()]
+
 class BLEOtherMethodSimulation:
     def __init__(self, scanning_interval, adv_interval, adv_window) -> None:
         # Parameters based on the description
@@ -23,13 +59,9 @@ class BLEOtherMethodSimulation:
 
         # Simulation parameters
         self.simulation_time = 10000  # Total simulation time in seconds
-        self.time_step = 125e-3  # Time step for the simulation in milliseconds
 
     # Function to simulate advertising events
     def advertise_event(self, Ta, rd):
-        A = random.uniform(self.A_min, self.A_max)  # Random Adv_PDU size between min and max
-        # adv_duration = A * 1e-6  # Convert to seconds (assuming 1 bit = 1 µs)
-        adv_duration = 0.64
         rd_delay = random.uniform(0, rd)
         return Ta + rd_delay, self.Ta  # Return adv event time and duration
 
@@ -40,38 +72,91 @@ class BLEOtherMethodSimulation:
         return False  # Scanner is inactive
 
     def run(self):
-        current_time = 0
+        """
+        Simulate until the advertiser is discovered.
+
+        The simulation jumps from one advertising event to the next and computes
+        the overlap with the scan windows analytically, so the cost is
+        proportional to the number of advertising events.
+
+        Returns:
+        float: The discovery time, or `simulation_time` if no discovery occurred.
+        """
         Ta = self.adv_interval
-        discovery_time = None
         advertising_event_count = 1
         advertiser_next_event, adv_duration = self.advertise_event(Ta * advertising_event_count, self.rd_max)
 
-        while current_time < self.simulation_time:
-            # Scanner logic
-            if self.scanner_event(current_time):
-                # Check if the advertiser's event overlaps with the scanner's window
-                if advertiser_next_event <= current_time <= advertiser_next_event + adv_duration:
-                    discovery_time = current_time
-                    break  # Discovery successful, stop the simulation
+        while advertiser_next_event < self.simulation_time:
+            # Check if the advertiser's event overlaps with the scanner's window
+            discovery_time = first_scan_overlap(advertiser_next_event,
+                                                advertiser_next_event + adv_duration,
+                                                self.T, self.Ts)
+            if discovery_time < self.simulation_time:
+                return discovery_time
+
+            advertising_event_count += 1
+            advertiser_next_event, adv_duration = self.advertise_event(Ta * advertising_event_count, self.rd_max)
+
+        return self.simulation_time
+
+
+class BatchBLEOtherMethodSimulation(BLEOtherMethodSimulation):
+    """
+    A vectorized version of `BLEOtherMethodSimulation` that simulates many
+    advertiser/scanner pairs at once with NumPy arrays.
+    """
+    def __init__(self, scanning_interval, adv_interval, adv_window, max_block_elements=2**22) -> None:
+        super().__init__(scanning_interval, adv_interval, adv_window)
+        self.max_block_elements = max_block_elements
+
+    def run(self, num_trials, rng=None, block_size=16):
+        """
+        Simulate `num_trials` independent advertiser/scanner pairs.
+
+        Advertising events are generated in blocks, each with its own random
+        delay per trial, and the first overlap with the scan windows is searched
+        for the whole block at once. Only undiscovered trials are carried into
+        the next block, whose size doubles every round.
+
+        Parameters:
+        num_trials (int): The number of independent trials.
+        rng (int or numpy.random.Generator, optional): Seed or source of
+            randomness, fresh OS entropy when omitted.
+        block_size (int): The number of advertising events in the first block.
+
+        Returns:
+        array: The discovery time of every trial, `simulation_time` for the
+        trials without a discovery.
+        """
+        rng = np.random.default_rng(rng)
+
+        discovery_times = np.full(num_trials, float(self.simulation_time))
+        active = np.arange(num_trials)
+        advertising_event_count = 1
+
+        while active.size > 0 and advertising_event_count * self.adv_interval < self.simulation_time:
+            block = max(1, min(block_size, self.max_block_elements // active.size))
+            event_counts = advertising_event_count + np.arange(block)
 
-            # Update the advertiser's next event if the current one is done
-            if current_time >= advertiser_next_event + adv_duration:
-                advertising_event_count += 1
-                advertiser_next_event, adv_duration = self.advertise_event(Ta * advertising_event_count, self.rd_max)
+            advertiser_events = event_counts * self.adv_interval + rng.uniform(0, self.rd_max, size=(active.size, block))
+            discovery = first_scan_overlap(advertiser_events, advertiser_events + self.Ta, self.T, self.Ts)
+            discovered = discovery < self.simulation_time
 
-            current_time += self.time_step
+            found = discovered.any(axis=1)
+            first_event = discovered.argmax(axis=1)
+            rows = np.nonzero(found)[0]
+            discovery_times[active[rows]] = discovery[rows, first_event[rows]]
+
+            active = active[~found]
+            advertising_event_count += block
+            block_size *= 2
+
+        return discovery_times
 
-        if discovery_time:
-            print(f"Advertiser discovered at time {discovery_time:.3f} seconds")
-            return discovery_time
-        else:
-            print("No discovery occurred within the simulation time.")
-            return self.simulation_time
 
 def run_simulation(scanning_interval, adv_interval, adv_window):
     latency_results = []
 
-    arr = [0] * 100000
     for _ in range(num_simulations):
         
         simulation = BLEOtherMethodSimulation(scanning_interval,
@@ -81,13 +166,31 @@ def run_simulation(scanning_interval, adv_interval, adv_window):
 
         latency_results.append(latency)
 
-    beacon_distribution = []
-    for i in range(1, len(arr)):
-        if arr[i-1] > 0:
-            beacon_distribution.extend([i] * arr[i-1])
-    
     avg_latency = np.mean(latency_results)
 
     return {
         "avg_latency": avg_latency,
+    }
+
+
+def run_batch_simulation(scanning_interval, adv_interval, adv_window, num_trials=num_batch_simulations, rng=None):
+    """
+    Simulate the periodic-scan baseline at the same scale as `lib.ble_simulation.run_simulation`.
+
+    Returns:
+    dict: The average latency (undiscovered trials count as `simulation_time`),
+    its confidence interval and the fraction of undiscovered trials.
+    """
+    rng = np.random.default_rng(rng)
+    simulation = BatchBLEOtherMethodSimulation(scanning_interval,
+                                               adv_interval=adv_interval,
+                                               adv_window=adv_window)
+    latency_results = simulation.run(num_trials, rng=rng)
+    lower_ci, upper_ci = calculate_ci(latency_results)
+
+    return {
+        "avg_latency": np.mean(latency_results),
+        "lower_ci": lower_ci,
+        "upper_ci": upper_ci,
+        "undiscovered_fraction": np.mean(latency_results >= simulation.simulation_time),
     }
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""SimPy scenarios with many lost devices and many scanners.
+
+Every lost device beacons with its own period and beacon duration and every
+scanner scans with its own Poisson rate. A scanner discovers a lost device
+when one of its scans falls inside a beacon of that device, and the latency
+of every (scanner, lost device) pair is recorded.
+
+The beacons of every lost device are kept in its row of a ring buffer that
+only holds as many beacons as can overlap one instant, so memory does not
+grow with the length of the scenario. A scanner only checks the lost devices
+it has not discovered yet, and a lost device stops beaconing once every
+scanner has discovered it, so the work per event keeps shrinking.
+
+Given a `ChannelModel`, every beacon is split into one packet per advertising
+channel and every scan listens on one channel, cycling through them. A scan
+then only discovers a device if it falls into a packet on its channel that is
+neither lost to the packet error rate nor overlaps a packet of another device
+on that channel, so the discovery throughput can be measured against the
+number of devices in range:
+
+    channel = ChannelModel(packet_error_rate=0.1)
+    result = Scenario(np.ones(100), 0.1, [1.0], until=100.0, channel=channel).run()
+"""
+import numpy as np
+import simpy
+
+from lib.ble_channel import periodic_collisions
+from lib.ble_simulation import LostDevice, ScannerDevice
+
+
+class BeaconRing:
+    """
+    Ring buffers of the most recent beacon start times of every lost device.
+    """
+    def __init__(self, num_devices, depth, num_channels=0) -> None:
+        """This constructor initializes empty buffers.
+
+        Args:
+            num_devices (int): The number of lost devices
+            depth (int): The number of beacons kept per device
+            num_channels (int): The number of packets per beacon whose
+                losses to errors are kept
+        """
+        self.depth = depth
+        self.times = np.full((num_devices, depth), -np.inf)
+        self.lost = np.zeros((num_devices, depth, num_channels), dtype=bool)
+        self.counts = np.zeros(num_devices, dtype=int)
+
+    def append(self, device, time, lost=None):
+        """Store the start of a beacon of `device` and which of its packets are lost, overwriting its oldest one."""
+        self.times[device, self.counts[device] % self.depth] = time
+        if lost is not None:
+            self.lost[device, self.counts[device] % self.depth] = lost
+        self.counts[device] += 1
+
+
+class ScenarioLostDevice(LostDevice):
+    """
+    A lost device writing its beacons to its row of a `BeaconRing`.
+    """
+    def __init__(self, env, index, period, beacon_duration, offset, beacon_events, rng, scenario):
+        self.index = index
+        self.offset = offset
+        self.rng = rng
+        self.scenario = scenario
+        super().__init__(env, period, beacon_duration, beacon_events)
+
+    def send_beacon(self):
+        channel = self.scenario.channel
+        yield self.env.timeout(self.offset)
+        # Beacons stop once every scanner has discovered the device
+        while self.scenario.remaining_scanners[self.index] > 0:
+            yield self.env.timeout(self.period)
+            lost = None if channel is None else channel.packet_errors(len(channel.channels), self.rng)
+            self.beacon_events.append(self.index, self.env.now, lost)
+
+
+class ScenarioScanner(ScannerDevice):
+    """
+    A scanner checking every scan against the lost devices it has not discovered yet.
+    """
+    def __init__(self, env, beacon_duration, rate, latency_results, beacon_events, rng, scenario):
+        self.rng = rng
+        self.scenario = scenario
+        super().__init__(env, beacon_duration, rate, latency_results, beacon_events)
+
+    def scan_beacon(self):
+        range_entrance_start_time = self.env.now
+        undiscovered = np.arange(len(self.latency_results))
+        beacon_duration = np.broadcast_to(self.beacon_duration, undiscovered.shape)[:, None]
+        channel = self.scenario.channel
+        if channel is not None:
+            scan_slot = self.rng.integers(len(channel.channels))
+
+        while undiscovered.size > 0:
+            yield self.env.timeout(self.rng.exponential(scale=1/self.rate))
+            current_time = self.env.now
+
+            beacon_times = self.beacon_events.times[undiscovered]
+            in_beacons = ((beacon_times <= current_time) &
+                          (current_time <= beacon_times + beacon_duration[undiscovered]))
+            if channel is not None:
+                in_beacons[in_beacons] = self.received(undiscovered, beacon_times, in_beacons, current_time, scan_slot)
+                scan_slot = (scan_slot + 1) % len(channel.channels)
+            in_beacon = in_beacons.any(axis=1)
+            if in_beacon.any():
+                discovered = undiscovered[in_beacon]
+                self.latency_results[discovered] = current_time - range_entrance_start_time
+                self.scenario.remaining_scanners[discovered] -= 1
+                undiscovered = undiscovered[~in_beacon]
+
+    def received(self, devices, beacon_times, in_beacons, time, scan_slot):
+        """
+        Check which beacons a scan falls into deliver a packet on the scanned channel.
+
+        Args:
+            devices (array): The device of every row of `beacon_times`
+            beacon_times (array): The beacon starts kept in the ring for these devices
+            in_beacons (array): True for every beacon the scan falls into
+            time (float): The time of the scan
+            scan_slot (int): The index of the channel the scan listens on
+
+        Returns:
+            array: For every True entry of `in_beacons`, whether its packet is received.
+        """
+        scenario = self.scenario
+        num_channels = len(scenario.channel.channels)
+        rows, depths = np.nonzero(in_beacons)
+        devices = devices[rows]
+        starts = beacon_times[rows, depths]
+        slots = np.minimum(((time - starts) / scenario.beacon_durations[devices] * num_channels).astype(int),
+                           num_channels - 1)
+
+        received = (slots == scan_slot) & ~self.beacon_events.lost[devices, depths, slots]
+        received[received] = ~periodic_collisions(devices[received], starts[received], slots[received],
+                                                  scenario.periods, scenario.beacon_durations, scenario.offsets,
+                                                  num_channels)
+        return received
+
+
+class Scenario:
+    """
+    A class to represent a discovery scenario of many lost devices and scanners.
+    """
+    def __init__(self, periods, beacon_durations, rates, until=None, channel=None) -> None:
+        """This constructor initializes the scenario parameters.
+
+        Args:
+            periods (array): The beacon period of every lost device
+            beacon_durations (float or array): The beacon duration of every lost device
+            rates (array): The scanning rate of every scanner
+            until (float, optional): The end of the scenario, by default it runs
+                until every scanner has discovered every lost device
+            channel (ChannelModel, optional): The advertising channels the
+                beacons are sent on. Collisions count the beacons of every
+                lost device, including the ones that stopped beaconing after
+                being discovered. By default every scan inside a beacon
+                discovers its device.
+        """
+        self.periods = np.atleast_1d(np.asarray(periods, dtype=float))
+        self.beacon_durations = np.broadcast_to(np.asarray(beacon_durations, dtype=float), self.periods.shape)
+        self.rates = np.atleast_1d(np.asarray(rates, dtype=float))
+        self.until = until
+        self.channel = channel
+        self.remaining_scanners = None
+        self.offsets = None
+
+    def run(self, rng=None):
+        """
+        Run the scenario with random beacon phases and scanning times.
+
+        Args:
+            rng: Seed or `np.random.Generator` of the scenario
+
+        Returns:
+            Dict with the (scanner, lost device) latency matrix, nan for pairs
+            not discovered before `until`, and its summary statistics.
+        """
+        rng = np.random.default_rng(np.random.randint(2**31) if rng is None else rng)
+        num_devices, num_scanners = len(self.periods), len(self.rates)
+
+        env = simpy.Environment()
+        # Beacons that can overlap one instant, plus the one just started
+        depth = int(np.max(np.ceil(self.beacon_durations / self.periods))) + 1
+        num_channels = 0 if self.channel is None else len(self.channel.channels)
+        beacon_events = BeaconRing(num_devices, depth, num_channels)
+        latencies = np.full((num_scanners, num_devices), np.nan)
+        self.remaining_scanners = np.full(num_devices, num_scanners)
+
+        self.offsets = rng.uniform(0, self.periods)
+        for i in range(num_devices):
+            ScenarioLostDevice(env, i, self.periods[i], self.beacon_durations[i], self.offsets[i],
+                               beacon_events, rng, self)
+        for j in range(num_scanners):
+            ScenarioScanner(env, self.beacon_durations, self.rates[j], latencies[j], beacon_events, rng, self)
+        env.run(until=self.until)
+
+        discovered = latencies[~np.isnan(latencies)]
+        return {
+            "latencies": latencies,
+            "avg_latency": np.mean(discovered) if discovered.size else np.nan,
+            "undiscovered_fraction": 1 - discovered.size / latencies.size,
+            "network_discovery_time": np.max(latencies),
+        }
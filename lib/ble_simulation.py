@@ -1,6 +1,8 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from lib import instrumentation
+from lib.accumulators import DiscoveryAccumulator, RunningMoments
+from lib.bootstrap import bootstrap_ci
 
 # Define constants
 num_simulations = 10000
@@ -47,6 +49,56 @@ class ScannerDevice:
                     self.latency_results.append(latency)
                     break
                 
+def find_beacon(y_k, beacon_period, beacon_duration):
+    """Find the beacon a scan at time `y_k` is matched against.
+
+    This is the beacon whose window ends at or after the scan, i.e. the
+    smallest n >= 1 with y_k <= nL + omega/2. When the beacon windows do not
+    overlap (omega < L) this is the nearest beacon, round(y_k / L), and the
+    scan discovers it iff |y_k - nL| <= omega/2. The lookup is O(1) and works
+    element-wise on NumPy arrays.
+
+    Args:
+        y_k (float or array): The time of the scanning event
+        beacon_period (float or array): The time period between two beacon events
+        beacon_duration (float or array): The duration of the beacon event
+
+    Returns:
+        Tuple (n, discovered) with the beacon index and whether the scan
+        falls inside that beacon's window.
+    """
+    half_duration = beacon_duration / 2
+    if isinstance(y_k, (int, float)) and isinstance(beacon_period, (int, float)) and \
+            isinstance(beacon_duration, (int, float)):
+        # Plain ceiling division, avoiding NumPy's per-call scalar overhead
+        n = max(-((half_duration - y_k) // beacon_period), 1)
+        return n, y_k >= n * beacon_period - half_duration
+
+    y_k = np.asarray(y_k, dtype=float)
+    n = np.ceil((y_k - half_duration) / beacon_period)
+    n = np.maximum(n, 1, out=n if isinstance(n, np.ndarray) else None)
+    discovered = y_k >= n * beacon_period - half_duration
+    return n[()], discovered[()]
+
+
+def advance_beacon(y_k, beacon_period, beacon_duration, n_i):
+    """Advance the beacon index of a scalar scan sequence to the scan at `y_k`.
+
+    Scans come in increasing order, so most of them fall before the end of
+    the window of the current beacon `n_i` and cost one comparison, as in a
+    beacon-advance loop. A scan after that window jumps straight to its
+    beacon with the O(1) `find_beacon` lookup instead of walking the beacons
+    in between.
+
+    Returns:
+        Tuple (n, discovered) as `find_beacon`, with n an int.
+    """
+    half_duration = beacon_duration / 2
+    if y_k > n_i * beacon_period + half_duration:
+        n_i = int(-((half_duration - y_k) // beacon_period))
+    return n_i, y_k >= n_i * beacon_period - half_duration
+
+
 class Simulation:
     """
     A class to represent a simulation of neighbor discovery of BLE devices.
@@ -66,7 +118,7 @@ class Simulation:
     def run(self, arr, include_energy_cost=False):
         # The time of the kth scanning event
         y_k = 0
-        # The index of the beacon event
+        # The index of the beacon event the scans are checked against
         n_i = 1
         arr_y_ks = []
         total_energy_cost = 0
@@ -80,21 +132,16 @@ class Simulation:
             y_k += x_i
             arr_y_ks.append(y_k)
             
-            # The left and right bounds of the beacon event
-            a = n_i * self.beacon_period - self.beacon_duration / 2
-            b = n_i * self.beacon_period + self.beacon_duration / 2
-            
-            # If the scanning event happens before the beacon event
-            # then we need to keep generating beacon events.
-            while y_k > b:
-                n_i += 1
-                a = n_i * self.beacon_period - self.beacon_duration / 2
-                b = n_i * self.beacon_period + self.beacon_duration / 2
+            n_i, discovered = advance_beacon(y_k, self.beacon_period, self.beacon_duration, n_i)
 
             # Discovery has happened
-            if a <= y_k <= b:
+            if discovered:
                 arr[n_i-1] += 1
-                # print(f'Discovery has happened after beacon: {n_i}, time: {y_k}, a: {a}, b: {b}')
+                if instrumentation.enabled:
+                    instrumentation.count("simulation.trials")
+                    instrumentation.count("simulation.scans", len(arr_y_ks))
+                    instrumentation.count("simulation.beacons_advanced", n_i)
+                # print(f'Discovery has happened after beacon: {n_i}, time: {y_k}')
                 # draw_neighbor_discovery_process(self.beacon_period, self.beacon_duration, n_i, arr_y_ks)
                 total_energy_cost = n_i * energy_cost_of_beacon * \
                     self.beacon_duration + \
@@ -105,7 +152,102 @@ class Simulation:
                 return y_k
 
 
+class BatchSimulation:
+    """
+    A vectorized version of `Simulation` that runs many independent
+    discovery trials at once with NumPy arrays.
+    """
+    def __init__(self, rate, beacon_duration, beacon_period) -> None:
+        """This constructor initializes the simulation parameters.
+
+        Args:
+            rate (float or array): the rate of scanning events
+            beacon_duration (float or array): The duration of the beacon event
+            beacon_period (float or array): The time period between two beacon events
+
+        Array parameters are broadcast against the number of trials, so one
+        batch can mix several parameter points.
+        """
+        self.rate = rate
+        self.beacon_duration = beacon_duration
+        self.beacon_period = beacon_period
+
+    def run(self, num_trials, rng=None):
+        """Simulate `num_trials` independent discovery processes.
+
+        Every trial follows the same process as `Simulation.run`: scan gaps
+        are exponential and discovery happens at the first scan that lands
+        inside a beacon window. The scans are a Poisson process, so instead
+        of drawing them one by one every trial is drawn in O(1) from the
+        exact distribution of that process:
+
+        - With separate windows (omega <= L) every window holds a scan
+          independently with probability q = 1 - exp(-lambda * omega), so the
+          discovering beacon is geometric with parameter q and the first scan
+          in its window is an exponential offset truncated to omega.
+        - With overlapping windows (omega > L) the windows cover all time
+          from max(L - omega/2, 0) on and discovery is the first scan after
+          that, an exponential offset from there.
+
+        All scans before the discovering one fall between the windows, so
+        their number is Poisson with mean lambda times the time between the
+        windows up to the latency.
+
+        Args:
+            num_trials (int): The number of independent trials
+            rng (numpy.random.Generator, optional): Source of randomness,
+                defaults to a generator seeded from the global `np.random`
+                state so that `np.random.seed` keeps runs reproducible.
+
+        Returns:
+            Tuple of arrays (latencies, energy_costs, beacon_indices), one
+            entry per trial. Beacon indices start at 1 as in `Simulation.run`.
+        """
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**31))
+        rate, beacon_duration, beacon_period = (
+            np.asarray(value, dtype=float)
+            for value in (self.rate, self.beacon_duration, self.beacon_period))
+
+        separate = beacon_duration <= beacon_period
+        hit_probability = np.where(separate, -np.expm1(-rate * beacon_duration), 1.0)
+        first_window = np.maximum(beacon_period - beacon_duration / 2, 0)
+
+        # The geometric number of windows missed and the offset of the
+        # discovering scan from the start of its window, a truncated
+        # exponential, both drawn by inverting their CDFs. A window that is
+        # always hit (q = 1) divides by log(0) = -inf and misses none.
+        with np.errstate(divide='ignore'):
+            windows_missed = np.floor(np.log1p(-rng.random(num_trials)) / np.log1p(-hit_probability))
+        offsets = -np.log1p(-rng.random(num_trials) * hit_probability) / rate
+        latencies = first_window + windows_missed * beacon_period + offsets
+
+        # Time before the discovering window that no window covers
+        uncovered_time = np.where(separate, first_window + windows_missed * (beacon_period - beacon_duration),
+                                  first_window)
+        scan_counts = rng.poisson(rate * uncovered_time) + 1
+        if np.all(separate):
+            beacon_indices = windows_missed + 1
+        elif not np.any(separate):
+            beacon_indices = find_beacon(latencies, beacon_period, beacon_duration)[0]
+        else:
+            beacon_indices = np.where(separate, windows_missed + 1,
+                                      find_beacon(latencies, beacon_period, beacon_duration)[0])
+        beacon_indices = beacon_indices.astype(np.int64)
+
+        if instrumentation.enabled:
+            instrumentation.count("batch_simulation.trials", num_trials)
+            instrumentation.count("batch_simulation.scans", int(scan_counts.sum()))
+            instrumentation.count("batch_simulation.beacons_advanced", int(beacon_indices.sum()))
+
+        energy_costs = beacon_indices * energy_cost_of_beacon * beacon_duration + \
+            scan_counts * energy_cost_of_scanning
+        return latencies, energy_costs, beacon_indices
+
+
 def draw_neighbor_discovery_process(L, omega, n_beacons_top, t_scans):
+    import matplotlib.pyplot as plt
+
     t_top = [i*L for i in range(n_beacons_top+1)]
 
     fig, ax = plt.subplots(figsize=(10, 5))
@@ -133,25 +275,22 @@ def draw_neighbor_discovery_process(L, omega, n_beacons_top, t_scans):
     plt.show()
 
 
-def calculate_ci_bootstrapping(data, confidence_level=0.95):
+def calculate_ci_bootstrapping(data, confidence_level=0.95, num_resamples=10000, method='percentile', rng=None):
     """
     Calculates confidence interval for average latency using bootstrapping.
 
     Args:
         data: List of simulated latency values for a specific L value.
-        num_iterations: Number of resampled datasets to generate (default 1000).
         confidence_level: Desired confidence level for the interval (default 0.95).
+        num_resamples: Number of resampled datasets to generate (default 10000).
+        method: 'percentile' or 'bca', see `lib.bootstrap.bootstrap_ci`.
+        rng: Seed or `np.random.Generator` of the resampling.
 
     Returns:
         Tuple containing lower and upper confidence limit for the average latency.
     """
-    resampled_latencies = []
-    for _ in range(num_simulations):
-        resample = np.random.choice(data, size=len(data), replace=True)  # Resample with replacement
-        resampled_latencies.append(np.mean(resample))  # Calculate average latency for resampled set
-
-    percentiles = np.percentile(resampled_latencies, [confidence_level * 100 / 2, 100 - confidence_level * 100 / 2])
-    return percentiles[0], percentiles[1]  # Lower and upper confidence limit
+    return bootstrap_ci(data, num_resamples=num_resamples, confidence_level=confidence_level,
+                        method=method, rng=rng)
 
 
 def calculate_ci(latency_results):
@@ -168,8 +307,9 @@ def calculate_ci(latency_results):
     std_dev = np.std(latency_results)
     z_value = 1.96  # 95% confidence interval
     avg_latency = np.mean(latency_results)
-    lower_ci = avg_latency - z_value * (std_dev / np.sqrt(num_simulations))
-    upper_ci = avg_latency + z_value * (std_dev / np.sqrt(num_simulations))
+    n = len(latency_results)
+    lower_ci = avg_latency - z_value * (std_dev / np.sqrt(n))
+    upper_ci = avg_latency + z_value * (std_dev / np.sqrt(n))
     
     return lower_ci, upper_ci
 
@@ -182,6 +322,10 @@ def draw_histogram(arr, period, beacon_duration, rate, mean_latency, std_latency
         beacon_duration (number): The duration of the beacon event
         rate (number): The rate of scanning events
     """
+    # Plotting libraries are only imported when a plot is drawn
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Plot the histogram of the latency results
     sns.histplot(arr, bins=30, stat="density", kde=True, color="blue")
     
@@ -210,37 +354,184 @@ def draw_histogram(arr, period, beacon_duration, rate, mean_latency, std_latency
     plt.legend(fontsize='large')
     plt.grid()
     plt.show()
+
+def draw_latency_histogram(histogram, period, beacon_duration, rate, mean_latency, std_latency, num_bins=30):
+    """Draw the plots of `draw_histogram` from a `LatencyHistogram` instead of the latency values.
+
+    Args:
+        histogram (LatencyHistogram): The histogram of the latency results
+        period (number): The period of the beacon event
+        beacon_duration (number): The duration of the beacon event
+        rate (number): The rate of scanning events
+        num_bins (int): The number of bins of the density plot
+    """
+    # Plotting libraries are only imported when a plot is drawn
+    import matplotlib.pyplot as plt
+
+    # The histogram's CDF at equally spaced edges gives the density per bin
+    edges = np.linspace(histogram.min, histogram.max, num_bins + 1)
+    density = np.diff(histogram.cdf(edges)) / np.diff(edges)
+    plt.stairs(density, edges, fill=True, color="blue", alpha=0.4)
+
+    # Annotate the mean and standard deviation
+    plt.axvline(mean_latency, color='red', linestyle='--', label=f"Mean = {mean_latency:.2f}", linewidth=2)
+    plt.axvline(mean_latency + std_latency, color='green', linestyle=':', label=f"Mean + 1 Std Dev = {mean_latency + std_latency:.2f}", linewidth=2)
+    plt.axvline(mean_latency - std_latency, color='brown', linestyle=':', label=f"Mean - 1 Std Dev = {mean_latency - std_latency:.2f}", linewidth=2)
+
+    plt.xlabel("Discovery Latency")
+    plt.ylabel("Probability Density")
+    plt.legend(fontsize='large')
+    plt.show()
+
+    # Plot the CDF at the bin edges of the histogram
+    latencies = histogram.bin_edges()
+    latencies = latencies[(latencies >= histogram.min) & (latencies <= histogram.max)]
+    plt.figure(figsize=(8, 6))
+    plt.plot(latencies, histogram.cdf(latencies), linestyle='-', color='blue', label="Empirical CDF")
+    plt.axvline(mean_latency, color='red', linestyle='--', label=f"Mean = {mean_latency:.2f}")
+    plt.xlabel("Discovery Latency")
+    plt.ylabel("Cumulative Probability")
+    plt.legend(fontsize='large')
+    plt.grid()
+    plt.show()
                 
-def run_simulation(period, beacon_duration, rate, include_energy_cost=False):
-    latency_results = []
-    energy_cost_results = []
+def simulate_discovery(period, beacon_duration, rate, num_trials=num_simulations, rng=None):
+    """Simulate `num_trials` discovery processes without any reporting.
 
-    arr = [0] * 100000
-    for _ in range(num_simulations):
-        
-        simulation = Simulation(rate, beacon_duration, period)
-        if include_energy_cost:
-            latency, energy_cost = simulation.run(arr, include_energy_cost)
-            energy_cost_results.append(energy_cost)
-        else:
-            latency = simulation.run(arr)
+    Args:
+        period (number): The period of the beacon event
+        beacon_duration (number): The duration of the beacon event
+        rate (number): The rate of scanning events
+        num_trials (int): The number of independent trials
+        rng (numpy.random.Generator, optional): Source of randomness
 
-        latency_results.append(latency)
+    Returns:
+        Dict with the per-trial latencies and energy costs and the beacon
+        histogram, whose entry i counts the discoveries at beacon i + 1.
+    """
+    simulation = BatchSimulation(rate, beacon_duration, period)
+    latencies, energy_costs, beacon_indices = simulation.run(num_trials, rng=rng)
 
-    beacon_distribution = []
-    for i in range(1, len(arr)):
-        if arr[i-1] > 0:
-            beacon_distribution.extend([i] * arr[i-1])
-    
-    avg_latency = np.mean(latency_results)
-    std_latency = np.std(latency_results)
-    draw_histogram(latency_results, period, beacon_duration, rate, avg_latency, std_latency)
-    avg_energy_cost = np.mean(energy_cost_results) if include_energy_cost else None
-    lower_ci, upper_ci = calculate_ci(latency_results)
+    return {
+        "latencies": latencies,
+        "energy_costs": energy_costs,
+        "beacon_histogram": np.bincount(beacon_indices - 1),
+    }
+
+def accumulate_discovery(period, beacon_duration, rate, num_trials=num_simulations, rng=None,
+                         batch_size=100000, accumulator=None):
+    """Simulate `num_trials` discovery processes into a `DiscoveryAccumulator`.
 
+    Trials are run in batches of `batch_size` and only their summary is kept,
+    so the memory used does not grow with the number of trials.
+
+    Args:
+        period (number): The period of the beacon event
+        beacon_duration (number): The duration of the beacon event
+        rate (number): The rate of scanning events
+        num_trials (int): The number of independent trials
+        rng (numpy.random.Generator, optional): Source of randomness
+        batch_size (int): The number of trials simulated at once
+        accumulator (DiscoveryAccumulator, optional): Add the trials to this
+            accumulator instead of a new one
+
+    Returns:
+        DiscoveryAccumulator: The summary of the trials.
+    """
+    rng = np.random.default_rng(np.random.randint(2**31) if rng is None else rng)
+    accumulator = DiscoveryAccumulator() if accumulator is None else accumulator
+    simulation = BatchSimulation(rate, beacon_duration, period)
+
+    for start in range(0, num_trials, batch_size):
+        accumulator.update(*simulation.run(min(batch_size, num_trials - start), rng=rng))
+    return accumulator
+
+def run_simulation(period, beacon_duration, rate, include_energy_cost=False, sinks=(), rng=None,
+                   num_trials=num_simulations):
+    """Simulate a parameter point and summarize the latency.
+
+    Args:
+        period (number): The period of the beacon event
+        beacon_duration (number): The duration of the beacon event
+        rate (number): The rate of scanning events
+        include_energy_cost (bool): Include the average energy cost in the summary
+        sinks (iterable): Report sinks called with the parameters, the
+            `DiscoveryAccumulator` of the trials and the summary, see
+            `lib.reporting`. Nothing is plotted or written unless a sink is given.
+        rng (numpy.random.Generator, optional): Source of randomness
+        num_trials (int): The number of independent trials
+
+    Returns:
+        Dict with the average latency, average energy cost and confidence interval
+    """
+    with instrumentation.timer("run_simulation.simulate"):
+        result = accumulate_discovery(period, beacon_duration, rate, num_trials=num_trials, rng=rng)
+
+    # The normal confidence interval of `calculate_ci`
+    half_width = result.latency.ci_half_width()
+    summary = {
+        "avg_latency": result.latency.mean,
+        "avg_energy_cost": result.energy_cost.mean if include_energy_cost else None,
+        "lower_ci": result.latency.mean - half_width,
+        "upper_ci": result.latency.mean + half_width
+    }
+
+    params = {"period": period, "beacon_duration": beacon_duration, "rate": rate}
+    with instrumentation.timer("run_simulation.sinks"):
+        for sink in sinks:
+            sink(params, result, summary)
+
+    return summary
+
+def run_sequential_simulation(period, beacon_duration, rate, abs_tol=None, rel_tol=None,
+                              batch_size=1000, max_trials=1000000, include_energy_cost=False, rng=None):
+    """Simulate a parameter point until the mean latency is known precisely enough.
+
+    Trials are run in batches while keeping running Welford moments of the
+    latency. The simulation stops as soon as the half-width of the 95%
+    confidence interval is at most `abs_tol`, or at most `rel_tol` times the
+    mean latency, or when `max_trials` trials have been run.
+
+    Args:
+        period (number): The period of the beacon event
+        beacon_duration (number): The duration of the beacon event
+        rate (number): The rate of scanning events
+        abs_tol (float, optional): Target absolute half-width of the interval
+        rel_tol (float, optional): Target half-width relative to the mean latency
+        batch_size (int): The number of trials per batch
+        max_trials (int): Upper bound on the number of trials
+        include_energy_cost (bool): Include the average energy cost in the summary
+        rng (numpy.random.Generator, optional): Source of randomness
+
+    Returns:
+        Dict with the average latency, average energy cost, confidence interval,
+        the number of trials used and whether the tolerance was reached.
+    """
+    if abs_tol is None and rel_tol is None:
+        raise ValueError('Either abs_tol or rel_tol must be given')
+
+    simulation = BatchSimulation(rate, beacon_duration, period)
+    latency = RunningMoments()
+    energy_cost = RunningMoments()
+
+    converged = False
+    while latency.count < max_trials:
+        latencies, energy_costs, _ = simulation.run(min(batch_size, max_trials - latency.count), rng=rng)
+        latency.update(latencies)
+        energy_cost.update(energy_costs)
+
+        half_width = latency.ci_half_width()
+        if (abs_tol is not None and half_width <= abs_tol) or \
+                (rel_tol is not None and half_width <= rel_tol * abs(latency.mean)):
+            converged = True
+            break
+
+    half_width = latency.ci_half_width()
     return {
-        "avg_latency": avg_latency,
-        "avg_energy_cost": avg_energy_cost,
-        "lower_ci": lower_ci,
-        "upper_ci": upper_ci
-    }
\ No newline at end of file
+        "avg_latency": latency.mean,
+        "avg_energy_cost": energy_cost.mean if include_energy_cost else None,
+        "lower_ci": latency.mean - half_width,
+        "upper_ci": latency.mean + half_width,
+        "num_trials": latency.count,
+        "converged": converged,
+    }
@@ -1,10 +1,14 @@
+import os
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from enum import Enum
 
-from lib.math import analytical_latency_result, average_energy_consumption
-from lib.ble_simulation import run_simulation
+from lib import instrumentation
+from lib.math import analytical_latency_result, adaptive_latency_result, average_energy_consumption
+from lib.ble_simulation import num_simulations, run_simulation
+from lib.latency_oracle import LatencyOracle
+from lib.latency_surface import LatencySurface
 
 # Define low and high values for parameters
 OMEGA_LOW = 0.1
@@ -18,25 +22,90 @@ LAMBDA_HIGH = 1.0
 class ComputationMethod(Enum):
     ANALYTICAL = 1
     SIMULATION = 2
+    SURFACE = 3
+
+
+def make_action_space():
+    # Continuous range of omega, L, and lambda
+    return spaces.Box(low=np.array([OMEGA_LOW, L_LOW, LAMBDA_LOW]), high=np.array([OMEGA_HIGH, L_HIGH, LAMBDA_HIGH]), shape=(3,), dtype=np.float32)
+
+
+def make_observation_space():
+    # Observations are dictionaries with the lost_device's and the scanner's parameters.
+    return spaces.Dict(
+        {
+            # For lost device the parameters are omega(beacon width) and L(advertising interval)
+            "lost_device": spaces.Box(low=np.array([OMEGA_LOW, L_LOW]), high=np.array([OMEGA_HIGH, L_HIGH]), shape=(2,), dtype=np.float32),
+            # For scanner the parameter is lambda(scanning rate)
+            "scanner": spaces.Box(low=LAMBDA_LOW, high=LAMBDA_HIGH, shape=(1,), dtype=np.float32),
+        }
+    )
+
+
+def calculate_reward(latency, energy, alpha, beta):
+    """Calculate the reward of a step, element-wise for arrays of latency and energy."""
+    # Calculate reward (negative of objective):
+    # In this Bluetooth neighbor discovery problem, 
+    # the reward is expressed as the negative of the 
+    # objective function, which is a common approach 
+    # to transform a minimization problem into a maximization one.
+    reward = -(alpha * latency + beta * energy)
+
+    # Additional reward for significant improvements
+    reward = reward + np.where(latency < 5.0, 10.0, 0.0)  # Bonus for very low latency
+    reward = reward + np.where(energy < 5.0, 5.0, 0.0)  # Bonus for very low energy consumption
+    return reward[()]
+
+
+def is_goal_reached(latency, energy):
+    """Whether the latency and energy are low enough to end the episode."""
+    return (np.asarray(latency) < 5.0) & (np.asarray(energy) < 28.0)
+
 
 class BluetoothDiscoveryEnv(gym.Env):
-    def __init__(self, computation_method=ComputationMethod.ANALYTICAL) -> None:
+    def __init__(self, computation_method=ComputationMethod.ANALYTICAL, latency_tol=None,
+                 cache_size=4096, cache_quantum=None, cache_path=None,
+                 surface_path=None, surface_kind='analytical', surface_method='linear',
+                 simulation_trials=num_simulations, simulation_seed=None) -> None:
         super(BluetoothDiscoveryEnv, self).__init__()
 
         self.computation_method = computation_method
+        # Truncation tolerance of the analytical model, None keeps the fixed
+        # n_limit/k_limit of 100/100
+        self.latency_tol = latency_tol
+
+        # Trials per simulated point. With a seed every point is simulated
+        # with its own generator derived from the seed and the point, so the
+        # results are reproducible and can be persisted.
+        self.simulation_trials = simulation_trials
+        self.simulation_seed = simulation_seed
+
+        # Precomputed latency surface, see `lib.latency_surface`
+        self.surface = None
+        if computation_method == ComputationMethod.SURFACE:
+            self.surface = LatencySurface(surface_path, kind=surface_kind, method=surface_method)
+
+        # Latency and energy of visited (omega, L, lambda) points are cached,
+        # optionally on a quantized grid and persisted to `cache_path`.
+        # Unseeded simulation results are random, so they are not persisted.
+        namespace = f'{computation_method.name}:{latency_tol}:'
+        if self.surface is not None:
+            namespace += f'{os.path.abspath(surface_path)}:{surface_kind}:{surface_method}:{self.surface.digest}:'
+        if computation_method == ComputationMethod.SIMULATION:
+            namespace += f'{simulation_trials}:{simulation_seed}:'
+            if simulation_seed is None:
+                cache_path = None
+        self.oracle = LatencyOracle(self._compute_info,
+                                    quantum=cache_quantum,
+                                    maxsize=cache_size,
+                                    path=cache_path,
+                                    namespace=namespace)
         
         # Define action space: continuous range of omega, L, and lambda
-        self.action_space = spaces.Box(low=np.array([OMEGA_LOW, L_LOW, LAMBDA_LOW]), high=np.array([OMEGA_HIGH, L_HIGH, LAMBDA_HIGH]), shape=(3,), dtype=np.float32)
+        self.action_space = make_action_space()
         
         # Observations are dictionaries with the lost_device's and the scanner's parameters.
-        self.observation_space = spaces.Dict(
-            {
-                # For lost device the parameters are omega(beacon width) and L(advertising interval)
-                "lost_device": spaces.Box(low=np.array([OMEGA_LOW, L_LOW]), high=np.array([OMEGA_HIGH, L_HIGH]), shape=(2,), dtype=np.float32),
-                # For scanner the parameter is lambda(scanning rate)
-                "scanner": spaces.Box(low=LAMBDA_LOW, high=LAMBDA_HIGH, shape=(1,), dtype=np.float32),
-            }
-        )
+        self.observation_space = make_observation_space()
         
         # Define initial state
         self.alpha = 0.5
@@ -51,26 +120,17 @@ class BluetoothDiscoveryEnv(gym.Env):
         omega, L, lambda_ = action
         
         observation = self._get_observation(omega, L, lambda_)
-        info = self._get_info(omega, L, lambda_)
+        with instrumentation.timer("env.info"):
+            info = self._get_info(omega, L, lambda_)
         latency = info['latency']
         energy = info['energy']
         
-        # Calculate reward (negative of objective):
-        # In this Bluetooth neighbor discovery problem, 
-        # the reward is expressed as the negative of the 
-        # objective function, which is a common approach 
-        # to transform a minimization problem into a maximization one.
-        reward = -(self.alpha * latency + self.beta * energy)
-
-        # Additional reward for significant improvements
-        if latency < 5.0:
-            reward += 10.0  # Bonus for very low latency
-        if energy < 5.0:
-            reward += 5.0  # Bonus for very low energy consumption
+        reward = calculate_reward(latency, energy, self.alpha, self.beta)
 
         # Episode termination condition
-        done = latency < 5.0 and energy < 28.0 or self.current_step >= self.max_steps
+        done = bool(is_goal_reached(latency, energy)) or self.current_step >= self.max_steps
         self.current_step += 1
+        instrumentation.step()
         
         return observation, reward, done, False, info
     
@@ -81,6 +141,9 @@ class BluetoothDiscoveryEnv(gym.Env):
         }
         
     def _get_info(self, omega, L, lambda_):
+        return dict(self.oracle(omega, L, lambda_))
+
+    def _compute_info(self, omega, L, lambda_):
 
         if self.computation_method == ComputationMethod.ANALYTICAL:
             # calculate latency
@@ -88,17 +151,30 @@ class BluetoothDiscoveryEnv(gym.Env):
             # calculate energy usage
             energy = self.calculate_energy(omega=omega, L=L, lambda_=lambda_)
         elif self.computation_method == ComputationMethod.SIMULATION:
-            result = run_simulation(period=L, beacon_duration=omega, rate=lambda_, include_energy_cost=True)
+            result = run_simulation(period=L, beacon_duration=omega, rate=lambda_, include_energy_cost=True,
+                                    rng=self._simulation_rng(omega, L, lambda_),
+                                    num_trials=self.simulation_trials)
             latency = result['avg_latency']
             energy = result['avg_energy_cost']
+        elif self.computation_method == ComputationMethod.SURFACE:
+            latency = self.surface(omega, L, lambda_)
+            energy = self.calculate_energy(omega=omega, L=L, lambda_=lambda_)
 
         return {
             'latency': latency,
             'energy': energy
         }
     
+    def _simulation_rng(self, omega, L, lambda_):
+        if self.simulation_seed is None:
+            return None
+        point = np.array([omega, L, lambda_], dtype=float).view(np.uint64)
+        return np.random.default_rng([self.simulation_seed, *point.tolist()])
+
     def calculate_latency(self, L, omega, lambda_):
         params = (L, omega, lambda_)
+        if self.latency_tol is not None:
+            return adaptive_latency_result(params, tol=self.latency_tol)['latency']
         latency = analytical_latency_result(params, 100, 100)
         return latency
     
@@ -125,4 +201,8 @@ class BluetoothDiscoveryEnv(gym.Env):
     
     def render(self, mode='human'):
         # Render the environment (if needed)
-        pass
\ No newline at end of file
+        pass
+
+    def close(self):
+        self.oracle.close()
+        super().close()
@@ -0,0 +1,159 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+from lib import instrumentation
+from lib.ble_simulation import BatchSimulation, num_simulations
+from lib.bluetooth_discovery_env import (OMEGA_LOW, OMEGA_HIGH, L_LOW, L_HIGH, LAMBDA_LOW, LAMBDA_HIGH,
+                                         ComputationMethod, calculate_reward, is_goal_reached,
+                                         make_action_space, make_observation_space)
+from lib.latency_surface import LatencySurface
+from lib.math import analytical_latency_result, adaptive_latency_result, average_energy_consumption
+
+
+class BluetoothDiscoveryVecEnv(VecEnv):
+    """
+    A natively vectorized version of `BluetoothDiscoveryEnv`.
+
+    All sub-environments are stepped together: the latencies and energies of
+    the whole batch of actions are computed with one call to the analytical,
+    simulation or surface backend. Finished sub-environments are reset
+    automatically, with their last observation in the `terminal_observation`
+    info as stable-baselines3 expects.
+    """
+    def __init__(self, num_envs, computation_method=ComputationMethod.ANALYTICAL, latency_tol=None,
+                 num_trials=num_simulations, surface_path=None, surface_kind='analytical',
+                 surface_method='linear', seed=None) -> None:
+        """This constructor initializes the environments.
+
+        Args:
+            num_envs (int): The number of sub-environments
+            computation_method (ComputationMethod): The latency backend
+            latency_tol (float, optional): Truncation tolerance of the
+                analytical model, None keeps the fixed n_limit/k_limit of 100/100
+            num_trials (int): The number of simulation trials per sub-environment and step
+            surface_path (str, optional): Directory of the latency surface for
+                `ComputationMethod.SURFACE`
+            surface_kind (str): Which stored surface to use
+            surface_method (str): Interpolation method of the surface
+            seed (int, optional): Seed of the initial states and the simulation
+        """
+        self.render_mode = None
+        super().__init__(num_envs, make_observation_space(), make_action_space())
+
+        self.computation_method = computation_method
+        self.latency_tol = latency_tol
+        self.num_trials = num_trials
+        self.surface = None
+        if computation_method == ComputationMethod.SURFACE:
+            self.surface = LatencySurface(surface_path, kind=surface_kind, method=surface_method)
+
+        self.alpha = 0.5
+        self.beta = 0.5
+        self.max_steps = 50
+
+        self.rng = np.random.default_rng(seed)
+        self.current_step = np.zeros(num_envs, dtype=int)
+        self.state = np.zeros((num_envs, 3))
+        self.actions = None
+
+    def calculate_info(self, omega, L, lambda_):
+        """Calculate the latency and energy of arrays of parameters in one batched call.
+
+        Returns:
+            Tuple of arrays (latency, energy)
+        """
+        if self.computation_method == ComputationMethod.SIMULATION:
+            simulation = BatchSimulation(np.repeat(lambda_, self.num_trials),
+                                         np.repeat(omega, self.num_trials),
+                                         np.repeat(L, self.num_trials))
+            latencies, energy_costs, _ = simulation.run(len(omega) * self.num_trials, rng=self.rng)
+            latency = latencies.reshape(len(omega), self.num_trials).mean(axis=1)
+            energy = energy_costs.reshape(len(omega), self.num_trials).mean(axis=1)
+            return latency, energy
+
+        if self.computation_method == ComputationMethod.SURFACE:
+            latency = self.surface(omega, L, lambda_)
+        elif self.latency_tol is not None:
+            latency = np.array([adaptive_latency_result(params, tol=self.latency_tol)['latency']
+                                for params in zip(L, omega, lambda_)])
+        else:
+            latency = analytical_latency_result((L, omega, lambda_), 100, 100)
+        energy = average_energy_consumption((L, omega, lambda_))
+        return np.atleast_1d(latency), np.atleast_1d(energy)
+
+    def _get_observation(self, state):
+        return {
+            "lost_device": state[:, :2].astype(np.float32),
+            "scanner": state[:, 2:].astype(np.float32),
+        }
+
+    def _random_state(self, size):
+        return np.column_stack([
+            self.rng.uniform(OMEGA_LOW, OMEGA_HIGH, size),
+            self.rng.uniform(L_LOW, L_HIGH, size),
+            self.rng.uniform(LAMBDA_LOW, LAMBDA_HIGH, size),
+        ])
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+
+        self.current_step[:] = 0
+        self.state = self._random_state(self.num_envs)
+        return self._get_observation(self.state)
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=float).reshape(self.num_envs, 3)
+
+    def step_wait(self):
+        omega, L, lambda_ = self.actions.T
+        with instrumentation.timer("vec_env.info"):
+            latency, energy = self.calculate_info(omega, L, lambda_)
+        rewards = np.asarray(calculate_reward(latency, energy, self.alpha, self.beta), dtype=np.float32)
+
+        terminated = is_goal_reached(latency, energy)
+        truncated = self.current_step >= self.max_steps
+        dones = terminated | truncated
+        self.current_step += 1
+
+        self.state = self.actions.copy()
+        observations = self._get_observation(self.state)
+        infos = [{'latency': latency[i], 'energy': energy[i]} for i in range(self.num_envs)]
+
+        finished = np.nonzero(dones)[0]
+        if finished.size > 0:
+            for i in finished:
+                infos[i]['terminal_observation'] = {key: value[i] for key, value in observations.items()}
+                infos[i]['TimeLimit.truncated'] = bool(truncated[i] and not terminated[i])
+            self.current_step[finished] = 0
+            self.state[finished] = self._random_state(finished.size)
+            observations = self._get_observation(self.state)
+
+        instrumentation.step(self.num_envs)
+        return observations, rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        # The sub-environments share their configuration
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._indices(indices)]
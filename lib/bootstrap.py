@@ -0,0 +1,118 @@
+"""Vectorized bootstrap confidence intervals for the mean latency."""
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+
+def _generator(rng):
+    # Without an explicit seed the generator is seeded from the global state,
+    # so that `np.random.seed` keeps results reproducible.
+    if rng is None:
+        return np.random.default_rng(np.random.randint(2**31))
+    return np.random.default_rng(rng)
+
+
+def bootstrap_means(data, num_resamples=10000, rng=None, max_chunk_elements=2**24):
+    """Return the means of `num_resamples` bootstrap resamples of `data`.
+
+    The resample indices are drawn as a 2-D integer array in chunks of at most
+    `max_chunk_elements` indices, and each chunk is reduced with one mean.
+    """
+    rng = _generator(rng)
+    data = np.asarray(data, dtype=float)
+    n = len(data)
+    chunk_size = max(1, max_chunk_elements // n)
+
+    means = np.empty(num_resamples)
+    for start in range(0, num_resamples, chunk_size):
+        size = min(chunk_size, num_resamples - start)
+        indices = rng.integers(0, n, size=(size, n), dtype=np.int32)
+        means[start:start + size] = np.take(data, indices).mean(axis=1)
+    return means
+
+
+def _bca_percentiles(data, means, alpha):
+    """Percentiles of the BCa interval of the mean of `data`."""
+    # Bias correction: how far the bootstrap distribution is shifted from the estimate
+    estimate = np.mean(data)
+    z0 = ndtri(np.mean(means < estimate))
+
+    # Acceleration from the jackknife means, which have a closed form for the mean
+    n = len(data)
+    jackknife = (np.sum(data) - data) / (n - 1)
+    deviations = np.mean(jackknife) - jackknife
+    denominator = 6 * np.sum(deviations**2)**1.5
+    acceleration = np.sum(deviations**3) / denominator if denominator > 0 else 0.0
+
+    z = ndtri(np.array([alpha / 2, 1 - alpha / 2]))
+    return 100 * ndtr(z0 + (z0 + z) / (1 - acceleration * (z0 + z)))
+
+
+def bootstrap_ci(data, num_resamples=10000, confidence_level=0.95, method='percentile',
+                 rng=None, max_chunk_elements=2**24):
+    """
+    Calculate a bootstrap confidence interval for the mean of `data`.
+
+    Args:
+        data: Array of simulated latency values.
+        num_resamples: Number of bootstrap resamples.
+        confidence_level: Desired confidence level for the interval.
+        method: 'percentile' or 'bca' (bias-corrected and accelerated).
+        rng: Seed or `np.random.Generator` of the resampling.
+        max_chunk_elements: Upper bound on the resample indices held in memory.
+
+    Returns:
+        Tuple containing lower and upper confidence limit for the mean.
+    """
+    data = np.asarray(data, dtype=float)
+    means = bootstrap_means(data, num_resamples, rng=rng, max_chunk_elements=max_chunk_elements)
+
+    alpha = 1 - confidence_level
+    if method == 'percentile':
+        percentiles = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    elif method == 'bca':
+        percentiles = _bca_percentiles(data, means, alpha)
+    else:
+        raise ValueError(f'Unknown bootstrap method: {method}')
+
+    lower, upper = np.percentile(means, percentiles)
+    return lower, upper
+
+
+def poisson_bootstrap_ci(chunks, num_resamples=1000, confidence_level=0.95, rng=None,
+                         max_chunk_elements=2**24):
+    """
+    Calculate a percentile confidence interval for the mean with the Poisson bootstrap.
+
+    Every observation enters every resample with an independent Poisson(1)
+    weight, so the data can be streamed in chunks without ever being held in
+    memory at once, e.g. straight from a large simulation.
+
+    Args:
+        chunks: Iterable of arrays of latency values, or a single array.
+        num_resamples: Number of bootstrap resamples.
+        confidence_level: Desired confidence level for the interval.
+        rng: Seed or `np.random.Generator` of the weights.
+        max_chunk_elements: Upper bound on the weights held in memory.
+
+    Returns:
+        Tuple containing lower and upper confidence limit for the mean.
+    """
+    rng = _generator(rng)
+    if isinstance(chunks, np.ndarray):
+        chunks = [chunks]
+
+    weighted_sums = np.zeros(num_resamples)
+    weight_totals = np.zeros(num_resamples)
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=float)
+        step = max(1, max_chunk_elements // num_resamples)
+        for start in range(0, len(chunk), step):
+            values = chunk[start:start + step]
+            weights = rng.poisson(1.0, size=(num_resamples, len(values)))
+            weighted_sums += weights @ values
+            weight_totals += weights.sum(axis=1)
+
+    means = weighted_sums / weight_totals
+    alpha = 1 - confidence_level
+    lower, upper = np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return lower, upper
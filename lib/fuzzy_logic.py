@@ -2,6 +2,158 @@ import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 
+# Marks (battery level, device role) inputs for which no rule fires
+UNDEFINED_QUORUM_SIZE = -1
+
+
+class QuorumSizeController:
+    """
+    A fuzzy controller recommending the quorum size of a device.
+
+    The rule base and the control system simulation are built once and reused
+    across calls. Inputs on the discrete universes of the fuzzy variables are
+    answered from a lookup table that is precomputed on first use; other
+    inputs are evaluated with the fuzzy control system.
+    """
+    def __init__(self) -> None:
+        # Define fuzzy variables
+        battery_level = ctrl.Antecedent(np.arange(0, 101, 1), 'battery_level')
+        traffic_load = ctrl.Antecedent(np.arange(0, 11, 1), 'traffic_load')
+        device_role = ctrl.Antecedent(np.arange(0, 2, 1), 'device_role')
+
+        quorum_size = ctrl.Consequent(np.arange(0, 11, 1), 'quorum_size')
+
+        # Membership functions
+        battery_level['very_low'] = fuzz.trapmf(battery_level.universe, [0, 0, 10, 30])
+        battery_level['low'] = fuzz.trimf(battery_level.universe, [10, 30, 50])
+        battery_level['medium'] = fuzz.trimf(battery_level.universe, [30, 50, 70])
+        battery_level['high'] = fuzz.trapmf(battery_level.universe, [50, 70, 100, 100])
+
+        traffic_load['low'] = fuzz.trapmf(traffic_load.universe, [0, 0, 2, 4])
+        traffic_load['medium'] = fuzz.trimf(traffic_load.universe, [2, 5, 8])
+        traffic_load['high'] = fuzz.trapmf(traffic_load.universe, [6, 8, 10, 10])
+
+        # Membership functions for device_role
+        device_role['advertiser'] = fuzz.trimf(device_role.universe, [0, 0, 1])
+        device_role['scanner'] = fuzz.trimf(device_role.universe, [1, 2, 2])
+
+        quorum_size['small'] = fuzz.trapmf(quorum_size.universe, [0, 0, 1, 4])
+        quorum_size['moderate'] = fuzz.trimf(quorum_size.universe, [2, 5, 8])
+        quorum_size['large'] = fuzz.trapmf(quorum_size.universe, [6, 8, 10, 10])
+
+        # Define rules
+        rule1 = ctrl.Rule(battery_level['very_low'] & device_role['advertiser'], quorum_size['large'])
+        rule2 = ctrl.Rule(battery_level['low'] & device_role['advertiser'], quorum_size['moderate'])
+        rule3 = ctrl.Rule(battery_level['medium'] & device_role['advertiser'], quorum_size['moderate'])
+        rule4 = ctrl.Rule(battery_level['high'] & device_role['advertiser'], quorum_size['small'])
+
+        # Create control system
+        quorum_ctrl = ctrl.ControlSystem([rule1, 
+                                          rule2,
+                                          rule3,
+                                          rule4,
+                                        ])
+        self.quorum_sim = ctrl.ControlSystemSimulation(quorum_ctrl)
+
+        self.battery_levels = battery_level.universe
+        self.device_roles = device_role.universe
+        self._table = None
+
+    def compute(self, battery_level_input, traffic_load_input, device_role_input):
+        """Evaluate the fuzzy control system, without the lookup table."""
+        # Input values
+        self.quorum_sim.input['battery_level'] = battery_level_input
+        # self.quorum_sim.input['traffic_load'] = traffic_load_input
+        self.quorum_sim.input['device_role'] = device_role_input
+
+        # Compute output
+        self.quorum_sim.compute()
+        return round(self.quorum_sim.output['quorum_size'])
+
+    @property
+    def table(self):
+        """Quorum sizes of all (battery level, device role) pairs of the universes."""
+        if self._table is None:
+            table = np.full((len(self.battery_levels), len(self.device_roles)), UNDEFINED_QUORUM_SIZE)
+            for i, battery_level in enumerate(self.battery_levels):
+                for j, device_role in enumerate(self.device_roles):
+                    try:
+                        table[i, j] = self.compute(battery_level, None, device_role)
+                    except KeyError:
+                        # No rule fires, so the output is not defined
+                        pass
+            self._table = table
+        return self._table
+
+    def _table_indices(self, battery_level_input, device_role_input):
+        """Table indices of the inputs and a mask of the inputs on the table grid."""
+        battery_level_input = np.asarray(battery_level_input, dtype=float)
+        device_role_input = np.asarray(device_role_input, dtype=float)
+        on_grid = (np.mod(battery_level_input, 1) == 0) & (np.mod(device_role_input, 1) == 0) & \
+            (battery_level_input >= self.battery_levels[0]) & (battery_level_input <= self.battery_levels[-1]) & \
+            (device_role_input >= self.device_roles[0]) & (device_role_input <= self.device_roles[-1])
+        battery_index = np.where(on_grid, battery_level_input - self.battery_levels[0], 0).astype(int)
+        role_index = np.where(on_grid, device_role_input - self.device_roles[0], 0).astype(int)
+        return battery_index, role_index, on_grid
+
+    def __call__(self, battery_level_input, traffic_load_input, device_role_input):
+        """Return the recommended quorum size, see `get_recommended_quorum_size`."""
+        if isinstance(battery_level_input, (int, float)) and isinstance(device_role_input, (int, float)):
+            # Plain Python scalars skip the array conversion of `_table_indices`
+            battery_index = battery_level_input - self.battery_levels[0]
+            role_index = device_role_input - self.device_roles[0]
+            on_grid = battery_index == int(battery_index) and role_index == int(role_index) and \
+                0 <= battery_index < len(self.battery_levels) and 0 <= role_index < len(self.device_roles)
+            battery_index, role_index = int(battery_index), int(role_index)
+        else:
+            battery_index, role_index, on_grid = self._table_indices(battery_level_input, device_role_input)
+        if not on_grid:
+            return self.compute(battery_level_input, traffic_load_input, device_role_input)
+
+        recommended_quorum_size = int(self.table[battery_index, role_index])
+        if recommended_quorum_size == UNDEFINED_QUORUM_SIZE:
+            raise KeyError('quorum_size')
+        return recommended_quorum_size
+
+    def compute_batch(self, battery_level_inputs, traffic_load_inputs, device_role_inputs):
+        """
+        Return the recommended quorum sizes of arrays of inputs.
+
+        Inputs for which no rule fires get `UNDEFINED_QUORUM_SIZE` instead of
+        raising like the scalar call.
+        """
+        battery_level_inputs, device_role_inputs = np.broadcast_arrays(
+            np.asarray(battery_level_inputs, dtype=float), np.asarray(device_role_inputs, dtype=float))
+        battery_index, role_index, on_grid = self._table_indices(battery_level_inputs, device_role_inputs)
+
+        quorum_sizes = np.where(on_grid, self.table[battery_index, role_index], UNDEFINED_QUORUM_SIZE)
+
+        # Inputs between the grid points are evaluated once per distinct pair
+        off_grid = np.nonzero(~on_grid)
+        if off_grid[0].size > 0:
+            pairs = np.column_stack([battery_level_inputs[off_grid], device_role_inputs[off_grid]])
+            unique_pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+            unique_sizes = np.full(len(unique_pairs), UNDEFINED_QUORUM_SIZE)
+            for i, (battery_level, device_role) in enumerate(unique_pairs):
+                try:
+                    unique_sizes[i] = self.compute(battery_level, None, device_role)
+                except KeyError:
+                    pass
+            quorum_sizes[off_grid] = unique_sizes[inverse.ravel()]
+
+        return quorum_sizes
+
+
+_default_controller = None
+
+
+def get_quorum_size_controller():
+    """Return the shared `QuorumSizeController`, building it on first use."""
+    global _default_controller
+    if _default_controller is None:
+        _default_controller = QuorumSizeController()
+    return _default_controller
+
 
 def get_recommended_quorum_size(battery_level_input, 
                                 traffic_load_input,
@@ -15,56 +167,7 @@ def get_recommended_quorum_size(battery_level_input,
     Returns:
     int: The recommended quorum size calculated by the fuzzy logic system.
     """     
-    # Define fuzzy variables
-    battery_level = ctrl.Antecedent(np.arange(0, 101, 1), 'battery_level')
-    traffic_load = ctrl.Antecedent(np.arange(0, 11, 1), 'traffic_load')
-    device_role = ctrl.Antecedent(np.arange(0, 2, 1), 'device_role')
-
-    quorum_size = ctrl.Consequent(np.arange(0, 11, 1), 'quorum_size')
-
-    # Membership functions
-    battery_level['very_low'] = fuzz.trapmf(battery_level.universe, [0, 0, 10, 30])
-    battery_level['low'] = fuzz.trimf(battery_level.universe, [10, 30, 50])
-    battery_level['medium'] = fuzz.trimf(battery_level.universe, [30, 50, 70])
-    battery_level['high'] = fuzz.trapmf(battery_level.universe, [50, 70, 100, 100])
-
-    traffic_load['low'] = fuzz.trapmf(traffic_load.universe, [0, 0, 2, 4])
-    traffic_load['medium'] = fuzz.trimf(traffic_load.universe, [2, 5, 8])
-    traffic_load['high'] = fuzz.trapmf(traffic_load.universe, [6, 8, 10, 10])
-
-    # Membership functions for device_role
-    device_role['advertiser'] = fuzz.trimf(device_role.universe, [0, 0, 1])
-    device_role['scanner'] = fuzz.trimf(device_role.universe, [1, 2, 2])
-
-    quorum_size['small'] = fuzz.trapmf(quorum_size.universe, [0, 0, 1, 4])
-    quorum_size['moderate'] = fuzz.trimf(quorum_size.universe, [2, 5, 8])
-    quorum_size['large'] = fuzz.trapmf(quorum_size.universe, [6, 8, 10, 10])
-
-    # Define rules
-    rule1 = ctrl.Rule(battery_level['very_low'] & device_role['advertiser'], quorum_size['large'])
-    rule2 = ctrl.Rule(battery_level['low'] & device_role['advertiser'], quorum_size['moderate'])
-    rule3 = ctrl.Rule(battery_level['medium'] & device_role['advertiser'], quorum_size['moderate'])
-    rule4 = ctrl.Rule(battery_level['high'] & device_role['advertiser'], quorum_size['small'])
-    
-
-    # Create control system
-    quorum_ctrl = ctrl.ControlSystem([rule1, 
-                                      rule2,
-                                      rule3,
-                                      rule4,
-                                    ])
-    quorum_sim = ctrl.ControlSystemSimulation(quorum_ctrl)
-
-    # Input values
-    quorum_sim.input['battery_level'] = battery_level_input
-    # quorum_sim.input['traffic_load'] = traffic_load_input
-    quorum_sim.input['device_role'] = device_role_input
-
-    # Compute output
-    quorum_sim.compute()
-    recommended_quorum_size = round(quorum_sim.output['quorum_size'])
-    
-    return recommended_quorum_size
+    return get_quorum_size_controller()(battery_level_input, traffic_load_input, device_role_input)
 
 # Example usage
 # battery_level_input = 30
@@ -0,0 +1,228 @@
+"""Importance sampling of the tail of the discovery latency.
+
+At low scan rates and narrow beacon windows the interesting latencies are the
+tail quantiles (p99, p99.9), which plain Monte Carlo resolves only with very
+many trials. Here the scans inside the beacon windows are simulated with a
+lower, exponentially tilted rate lambda' under which long latencies are
+common, and every trial is weighted by the likelihood ratio of its scan path,
+
+    W = (lambda / lambda')^K * exp(-(lambda - lambda') * C(T)),
+
+where K = 1 is its number of scans inside the windows, the discovering one,
+and C(T) the window time covered up to its latency T. Scans outside the
+windows do not change the latency, so they keep the rate lambda; tilting
+them as well would multiply W by a factor with a variance so large that a few
+trials carry all the weight. As the latency does not depend on them, the
+trials are simulated with the rate lambda' everywhere.
+
+The mean of W * 1{T > t} estimates P(T > t) without bias, and the effective
+sample size (sum W)^2 / sum W^2 tells how many plain trials the weighted ones
+are worth.
+
+When the beacon windows do not overlap (omega <= L) every beacon is hit
+independently with probability `lib.math.beacon_hit_probability`, so the
+conditional estimator only samples the index of the discovering beacon (with
+a tilted hit probability) and computes the tail of the latency within its
+window exactly.
+
+    result = importance_sampling_tail(10.0, 0.05, 0.1, quantiles=(0.99, 0.999))
+    result["quantiles"], result["effective_sample_size"]
+"""
+import numpy as np
+
+from lib.ble_simulation import BatchSimulation
+from lib.math import beacon_hit_probability
+
+
+def approximate_quantile(period, beacon_duration, rate, q):
+    """
+    Approximate a latency quantile by a geometric number of missed beacons.
+
+    Windows of omega >= L cover all the time from the start of the first one
+    on, so there the latency is that start plus an exponential scan time and
+    the quantile is exact.
+
+    Returns:
+        The q-quantile of L times the number of beacons until the first hit.
+    """
+    q = np.asarray(q, dtype=float)
+    if beacon_duration >= period:
+        return (max(period - beacon_duration / 2, 0) - np.log1p(-q) / rate)[()]
+    hit_probability = np.clip(beacon_hit_probability(rate, beacon_duration), 1e-12, 1 - 1e-12)
+    return period * np.maximum(np.log1p(-q) / np.log1p(-hit_probability), 1)
+
+
+def choose_tilted_rate(period, beacon_duration, rate, threshold):
+    """
+    Choose the tilted scan rate under which the mean latency is about `threshold`.
+
+    Under the tilted rate a beacon is hit with probability L / threshold, so
+    the trials end around the threshold; with overlapping windows (omega >= L)
+    the mean scan time after the start of the first window is the rest of the
+    threshold. The tilted rate is never above `rate`, a threshold below the
+    mean latency leaves the rate as it is.
+    """
+    if beacon_duration >= period:
+        remaining = threshold - max(period - beacon_duration / 2, 0)
+        return float(rate if remaining <= 0 else min(rate, 1 / remaining))
+    hit_probability = np.clip(period / threshold, 1e-12, 1 - 1e-12)
+    return float(min(rate, -np.log1p(-hit_probability) / beacon_duration))
+
+
+def covered_window_time(latencies, period, beacon_duration):
+    """
+    Return the time up to each latency that lies inside a beacon window.
+
+    A latency ends in a window, so with separate windows (omega < L) all
+    earlier windows are covered completely; windows of omega >= L cover
+    everything from the start of the first one on.
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    first_start = max(period - beacon_duration / 2, 0)
+    if beacon_duration >= period:
+        return np.maximum(latencies - first_start, 0)
+    n = np.maximum(np.ceil((latencies - beacon_duration / 2) / period), 1)
+    return (n - 1) * beacon_duration + np.clip(latencies - (n * period - beacon_duration / 2), 0, beacon_duration)
+
+
+def likelihood_ratios(latencies, period, beacon_duration, rate, tilted_rate):
+    """Return the weights (rate / tilted_rate) * exp(-(rate - tilted_rate) * C(T)) of the trials."""
+    return rate / tilted_rate * np.exp(-(rate - tilted_rate) * covered_window_time(latencies, period, beacon_duration))
+
+
+def effective_sample_size(weights):
+    """Return (sum W)^2 / sum W^2, the number of equally weighted trials the weights are worth."""
+    weights = np.asarray(weights, dtype=float)
+    return float(np.sum(weights)**2 / np.sum(weights**2)) if weights.size else 0.0
+
+
+def weighted_tail_probability(latencies, weights, threshold):
+    """
+    Estimate P(T > threshold) as the mean of W * 1{T > threshold}.
+
+    Returns:
+        Tuple (probability, standard_error), with the shape of `threshold`.
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    threshold = np.asarray(threshold, dtype=float)
+    terms = np.where(latencies > threshold[..., None], weights, 0.0)
+    probability = terms.mean(axis=-1)
+    standard_error = terms.std(axis=-1) / np.sqrt(latencies.size)
+    return probability[()], standard_error[()]
+
+
+def weighted_quantile(latencies, weights, q):
+    """
+    Estimate latency quantiles from weighted trials.
+
+    The q-quantile is the smallest latency whose estimated tail probability,
+    the mean of W * 1{T > latency}, is at most 1 - q. The tail is estimated
+    directly, so it does not depend on how well the weights estimate the
+    bulk of the distribution.
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    order = np.argsort(latencies)
+    sorted_latencies = latencies[order]
+    # Weight of the trials after each sorted trial
+    tail = np.concatenate([np.cumsum(np.asarray(weights, dtype=float)[order][::-1])[::-1][1:], [0.0]])
+    survival = tail / latencies.size
+
+    index = np.searchsorted(-survival, -(1 - np.asarray(q, dtype=float)), side='left')
+    return sorted_latencies[np.minimum(index, latencies.size - 1)][()]
+
+
+def importance_sampling_tail(period, beacon_duration, rate, threshold=None, quantiles=(0.99, 0.999),
+                             num_trials=10000, tilted_rate=None, rng=None):
+    """
+    Estimate the latency tail by simulating with a tilted scan rate.
+
+    Args:
+        period (float): The period of the beacon event L
+        beacon_duration (float): The duration of the beacon event omega
+        rate (float): The rate of scanning events lambda
+        threshold (float or array, optional): Estimate P(T > threshold),
+            approximately the largest of `quantiles` by default
+        quantiles (sequence): The latency quantiles to estimate
+        num_trials (int): The number of simulated trials
+        tilted_rate (float, optional): The scan rate of the simulation,
+            chosen from the largest threshold when omitted
+        rng (numpy.random.Generator, optional): Source of randomness
+
+    Returns:
+        Dict with the threshold, its "tail_probability" and "standard_error",
+        the "quantiles", the "effective_sample_size", the "tilted_rate" and
+        the per-trial "latencies" and "weights".
+    """
+    rng = np.random.default_rng(np.random.randint(2**31) if rng is None else rng)
+    if threshold is None:
+        threshold = approximate_quantile(period, beacon_duration, rate, max(quantiles))
+    if tilted_rate is None:
+        tilted_rate = choose_tilted_rate(period, beacon_duration, rate, np.max(threshold))
+
+    simulation = BatchSimulation(tilted_rate, beacon_duration, period)
+    latencies, _, _ = simulation.run(num_trials, rng=rng)
+    weights = likelihood_ratios(latencies, period, beacon_duration, rate, tilted_rate)
+    tail_probability, standard_error = weighted_tail_probability(latencies, weights, threshold)
+
+    return {
+        "threshold": threshold,
+        "tail_probability": tail_probability,
+        "standard_error": standard_error,
+        "quantiles": weighted_quantile(latencies, weights, quantiles),
+        "effective_sample_size": effective_sample_size(weights),
+        "tilted_rate": tilted_rate,
+        "latencies": latencies,
+        "weights": weights,
+    }
+
+
+def conditional_tail_probability(period, beacon_duration, rate, threshold, num_trials=10000,
+                                 tilted_rate=None, rng=None):
+    """
+    Estimate P(T > threshold) by conditional Monte Carlo over the discovering beacon.
+
+    The index N of the first beacon hit is geometric with the per-beacon hit
+    probability q and is drawn with the hit probability q' of the tilted
+    rate, weighted by (q / q') * ((1 - q) / (1 - q'))^(N - 1). Given N, the
+    first scan in the window is a truncated exponential, so P(T > threshold | N)
+    is exact and only the beacon index is random.
+
+    Args:
+        period (float): The period of the beacon event L
+        beacon_duration (float): The duration of the beacon event omega, at most L
+        rate (float): The rate of scanning events lambda
+        threshold (float or array): The latency threshold t
+        num_trials (int): The number of sampled beacon indices
+        tilted_rate (float, optional): The scan rate of the sampled hits,
+            chosen from the largest threshold when omitted
+        rng (numpy.random.Generator, optional): Source of randomness
+
+    Returns:
+        Dict with the threshold, its "tail_probability" and "standard_error",
+        the "effective_sample_size" and the "tilted_rate".
+    """
+    if beacon_duration > period:
+        raise ValueError('Overlapping beacon windows (omega > L) are not hit independently')
+    rng = np.random.default_rng(np.random.randint(2**31) if rng is None else rng)
+    if tilted_rate is None:
+        tilted_rate = choose_tilted_rate(period, beacon_duration, rate, np.max(threshold))
+
+    hit_probability = beacon_hit_probability(rate, beacon_duration)
+    tilted_hit_probability = beacon_hit_probability(tilted_rate, beacon_duration)
+    beacon_indices = rng.geometric(tilted_hit_probability, num_trials)
+    weights = np.exp(np.log(hit_probability / tilted_hit_probability) +
+                     (beacon_indices - 1) * (np.log1p(-hit_probability) - np.log1p(-tilted_hit_probability)))
+
+    # Time from the start of the discovering window to the threshold
+    threshold = np.asarray(threshold, dtype=float)
+    elapsed = np.clip(threshold[..., None] - (beacon_indices * period - beacon_duration / 2), 0, beacon_duration)
+    conditional_tail = (np.exp(-rate * elapsed) - np.exp(-rate * beacon_duration)) / hit_probability
+    terms = weights * conditional_tail
+
+    return {
+        "threshold": threshold[()],
+        "tail_probability": terms.mean(axis=-1)[()],
+        "standard_error": (terms.std(axis=-1) / np.sqrt(num_trials))[()],
+        "effective_sample_size": effective_sample_size(weights),
+        "tilted_rate": tilted_rate,
+    }
@@ -0,0 +1,126 @@
+"""Opt-in timers and counters of the simulation, analytical and environment hot paths.
+
+Instrumentation is off by default. The hooks in the library check the module
+flag `enabled` before doing any work, so the cost when disabled is one
+attribute lookup per hook. Enable it around the code of interest:
+
+    from lib import instrumentation
+
+    instrumentation.enable()
+    run_simulation(2.0, 0.5, 0.5)
+    print(instrumentation.snapshot())
+
+`lib.instrumentation_callback.InstrumentationCallback` records the snapshot
+to the TensorBoard log of a stable-baselines3 model, and `profile` dumps
+cProfile statistics of a block or of its first environment steps.
+"""
+import cProfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+enabled = False
+
+_counters = defaultdict(int)
+_timer_seconds = defaultdict(float)
+_timer_calls = defaultdict(int)
+_active_profile = None
+
+
+def enable():
+    """Start recording timers and counters."""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop recording timers and counters, keeping the values recorded so far."""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Clear all timers and counters."""
+    _counters.clear()
+    _timer_seconds.clear()
+    _timer_calls.clear()
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name`."""
+    if enabled:
+        _counters[name] += value
+
+
+def add_time(name, seconds):
+    """Add one call of `seconds` to the timer `name`."""
+    if enabled:
+        _timer_seconds[name] += seconds
+        _timer_calls[name] += 1
+
+
+@contextmanager
+def timer(name):
+    """Time the enclosed block under the timer `name`."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def snapshot():
+    """
+    Return the current values of all timers and counters.
+
+    Returns:
+        Dict with every counter under its name and every timer as
+        "<name>.seconds" (total) and "<name>.calls".
+    """
+    values = dict(_counters)
+    for name, seconds in _timer_seconds.items():
+        values[f"{name}.seconds"] = seconds
+        values[f"{name}.calls"] = _timer_calls[name]
+    return values
+
+
+def _finish_profile(state):
+    if not state["done"]:
+        state["profiler"].disable()
+        state["profiler"].dump_stats(state["path"])
+        state["done"] = True
+
+
+@contextmanager
+def profile(path, num_steps=None):
+    """
+    Profile the enclosed block with cProfile and dump the statistics to `path`.
+
+    With `num_steps`, profiling stops after that many environment steps (see
+    `step`) even if the block goes on, e.g. to profile the first steps of a
+    long training run. The dump can be read with `pstats` or turned into a
+    flame graph with tools such as snakeviz or flameprof.
+    """
+    global _active_profile
+    state = {"profiler": cProfile.Profile(), "path": path, "remaining": num_steps, "done": False}
+    _active_profile = state
+    state["profiler"].enable()
+    try:
+        yield state["profiler"]
+    finally:
+        _finish_profile(state)
+        _active_profile = None
+
+
+def step(num_steps=1):
+    """Mark the end of `num_steps` environment steps, called by the environments."""
+    if enabled:
+        _counters["env.steps"] += num_steps
+    state = _active_profile
+    if state is not None and state["remaining"] is not None and not state["done"]:
+        state["remaining"] -= num_steps
+        if state["remaining"] <= 0:
+            _finish_profile(state)
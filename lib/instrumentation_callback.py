@@ -0,0 +1,37 @@
+from stable_baselines3.common.callbacks import BaseCallback
+
+from lib import instrumentation
+
+
+class InstrumentationCallback(BaseCallback):
+    """
+    Records the timers and counters of `lib.instrumentation` to the model's logger.
+
+    The values land in the TensorBoard log dir passed to the model as
+    `tensorboard_log`, under `prefix/`, whenever the logger dumps.
+    """
+    def __init__(self, log_freq=1000, prefix='instrumentation', verbose=0) -> None:
+        """This constructor enables the instrumentation.
+
+        Args:
+            log_freq (int): Record the values every `log_freq` steps, and at the
+                end of every rollout
+            prefix (str): The TensorBoard section of the values
+            verbose (int): The verbosity level
+        """
+        super().__init__(verbose)
+        self.log_freq = log_freq
+        self.prefix = prefix
+        instrumentation.enable()
+
+    def _record(self):
+        for name, value in instrumentation.snapshot().items():
+            self.logger.record(f'{self.prefix}/{name}', value)
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.log_freq == 0:
+            self._record()
+        return True
+
+    def _on_rollout_end(self) -> None:
+        self._record()
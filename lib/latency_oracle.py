@@ -0,0 +1,117 @@
+import pickle
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+from lib import instrumentation
+
+
+class LatencyOracle:
+    """
+    A memoizing wrapper around a latency/energy computation.
+
+    Parameter points are quantized before lookup, so that nearly identical
+    (omega, L, lambda) actions share one cached result, and kept in a bounded
+    LRU cache. An optional on-disk SQLite store keeps the results across runs
+    and can be shared by several processes, SQLite locks the file around
+    every write.
+    """
+    def __init__(self, compute, quantum=None, maxsize=4096, path=None, namespace='') -> None:
+        """This constructor initializes the oracle.
+
+        Args:
+            compute (callable): Function of (omega, L, lambda_) returning the
+                result to cache, e.g. a dict with the latency and the energy.
+            quantum (float or sequence, optional): Grid step used to quantize
+                omega, L and lambda, either one value for all three or one per
+                parameter. None caches the exact parameter values.
+            maxsize (int): The maximum number of results kept in memory.
+            path (str, optional): File name of a persistent SQLite store.
+            namespace (str): Prefix of the persistent keys, so that results of
+                different computation methods can share one store. It must
+                identify everything the result depends on besides the point.
+        """
+        self.compute = compute
+        self.quantum = None if quantum is None else np.broadcast_to(np.asarray(quantum, dtype=float), (3,))
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._store = None
+        if path is not None:
+            # Autocommit, so that other processes see every result at once and
+            # the write lock is held only for one statement
+            self._store = sqlite3.connect(path, timeout=60, isolation_level=None)
+            self._store.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)')
+
+    def quantize(self, omega, L, lambda_):
+        """Map a parameter point to its cache key."""
+        values = np.array([omega, L, lambda_], dtype=float)
+        if self.quantum is not None:
+            values = np.round(values / self.quantum) * self.quantum
+        return tuple(float(value) for value in values)
+
+    def __call__(self, omega, L, lambda_):
+        """Return the (cached) result of `compute` at the quantized point."""
+        key = self.quantize(omega, L, lambda_)
+
+        if key in self._cache:
+            self.hits += 1
+            if instrumentation.enabled:
+                instrumentation.count("oracle.hits")
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        store_key = f'{self.namespace}{key}'
+        stored = self._load(store_key)
+        if stored is not None:
+            self.disk_hits += 1
+            if instrumentation.enabled:
+                instrumentation.count("oracle.disk_hits")
+            result = pickle.loads(stored)
+        else:
+            self.misses += 1
+            if instrumentation.enabled:
+                instrumentation.count("oracle.misses")
+            with instrumentation.timer("oracle.compute"):
+                result = self.compute(*key)
+            if self._store is not None:
+                self._store.execute('INSERT OR REPLACE INTO results VALUES (?, ?)',
+                                    (store_key, pickle.dumps(result)))
+
+        self._cache[key] = result
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return result
+
+    def _load(self, store_key):
+        if self._store is None:
+            return None
+        row = self._store.execute('SELECT value FROM results WHERE key = ?', (store_key,)).fetchone()
+        return None if row is None else row[0]
+
+    def cache_info(self):
+        """Return the hit/miss counters and the size of the in-memory cache."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self._cache),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self):
+        """Empty the in-memory cache and reset the counters."""
+        self._cache.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def close(self):
+        """Close the persistent store."""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
@@ -0,0 +1,191 @@
+"""Precomputed latency surface over the (omega, L, lambda) action space.
+
+The analytical (and optionally simulated) latency is evaluated once on a
+regular grid and stored as `.npy` files that are memory-mapped on load, so
+that latency lookups during RL training are an interpolation instead of a
+full model evaluation.
+
+Build and check a surface from the repository root:
+
+    python -m lib.latency_surface build --path surfaces/latency
+    python -m lib.latency_surface check --path surfaces/latency
+
+The default 37x46x37 grid builds in a few seconds. Against
+`analytical_latency_result` trilinear interpolation is within about 5% (0.2%
+on average). Cubic splines overshoot where the latency rises steeply towards
+low omega and lambda, by up to 10-30% on the default grid, so they are only
+worth it on finer grids.
+"""
+import argparse
+import hashlib
+import os
+
+import numpy as np
+from scipy.ndimage import map_coordinates, spline_filter
+
+from lib.ble_simulation import BatchSimulation
+from lib.math import analytical_latency_result
+
+AXES_FILE = 'axes.npz'
+SURFACE_FILES = {
+    'analytical': 'analytical_latency.npy',
+    'simulation': 'simulated_latency.npy',
+}
+
+
+def build_latency_surface(path, omega_range, L_range, lambda_range, shape=(37, 46, 37),
+                          n_limit=100, k_limit=100, include_simulation=False,
+                          num_trials=10000, chunk_size=64, seed=None):
+    """Evaluate the latency on a regular grid and save it to `path`.
+
+    Args:
+        path (str): Directory the surface files are written to.
+        omega_range (tuple): The (low, high) bounds of omega.
+        L_range (tuple): The (low, high) bounds of L.
+        lambda_range (tuple): The (low, high) bounds of lambda.
+        shape (tuple): Number of grid points along omega, L and lambda.
+        n_limit (int): The number of beacons of the analytical model.
+        k_limit (int): The number of scanning events of the analytical model.
+        include_simulation (bool): Also store the mean simulated latency.
+        num_trials (int): The number of simulation trials per grid point.
+        chunk_size (int): Number of grid points evaluated per vectorized call.
+        seed (int, optional): Seed of the simulation.
+    """
+    os.makedirs(path, exist_ok=True)
+    axes = [np.linspace(low, high, size)
+            for (low, high), size in zip((omega_range, L_range, lambda_range), shape)]
+    np.savez(os.path.join(path, AXES_FILE), omega=axes[0], L=axes[1], lambda_=axes[2])
+
+    omega, L, lambda_ = (grid.ravel() for grid in np.meshgrid(*axes, indexing='ij'))
+
+    latency = np.empty(omega.size)
+    for start in range(0, omega.size, chunk_size):
+        points = slice(start, start + chunk_size)
+        latency[points] = analytical_latency_result((L[points], omega[points], lambda_[points]),
+                                                    n_limit, k_limit)
+    np.save(os.path.join(path, SURFACE_FILES['analytical']), latency.reshape(shape).astype(np.float32))
+
+    if include_simulation:
+        rng = np.random.default_rng(seed)
+        simulated = np.empty(omega.size)
+        for i in range(omega.size):
+            latencies, _, _ = BatchSimulation(lambda_[i], omega[i], L[i]).run(num_trials, rng=rng)
+            simulated[i] = np.mean(latencies)
+        np.save(os.path.join(path, SURFACE_FILES['simulation']), simulated.reshape(shape).astype(np.float32))
+
+
+class LatencySurface:
+    """
+    Interpolates a latency surface written by `build_latency_surface`.
+    """
+    def __init__(self, path, kind='analytical', method='linear') -> None:
+        """This constructor memory-maps the surface.
+
+        Args:
+            path (str): Directory of the surface files.
+            kind (str): Either 'analytical' or 'simulation'.
+            method (str): 'linear' for trilinear or 'cubic' for cubic spline
+                interpolation, see the module docstring for their accuracy.
+        """
+        with np.load(os.path.join(path, AXES_FILE)) as axes:
+            self.axes = [axes['omega'], axes['L'], axes['lambda_']]
+        self.values = np.load(os.path.join(path, SURFACE_FILES[kind]), mmap_mode='r')
+        self.method = method
+
+        # Identifies the grid and its values, e.g. in the keys of cached results
+        digest = hashlib.sha1()
+        for array in (*self.axes, self.values):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        self.digest = digest.hexdigest()[:16]
+
+        self.lows = np.array([axis[0] for axis in self.axes])
+        self.highs = np.array([axis[-1] for axis in self.axes])
+        self.steps = np.array([axis[1] - axis[0] for axis in self.axes])
+        self.upper_cells = np.array(self.values.shape) - 2
+        if method == 'cubic':
+            # The spline coefficients are computed once, so every lookup only
+            # evaluates the spline.
+            self.coefficients = spline_filter(np.asarray(self.values, dtype=float), order=3)
+
+    def __call__(self, omega, L, lambda_):
+        """Return the interpolated latency, points outside the grid are clipped to it."""
+        point = np.array([omega, L, lambda_], dtype=float)
+        position = (np.clip(point.T, self.lows, self.highs) - self.lows) / self.steps
+
+        if self.method == 'cubic':
+            latency = map_coordinates(self.coefficients, np.atleast_2d(position).T, order=3, prefilter=False)
+            return latency.reshape(np.shape(position)[:-1])[()]
+
+        cell = np.minimum(position.astype(int), self.upper_cells)
+        i, j, k = cell.T
+        x, y, z = (position - cell).T
+        values = self.values.view(np.ndarray)
+
+        # Interpolate along lambda, then L, then omega
+        c00 = values[i, j, k] + z * (values[i, j, k + 1] - values[i, j, k])
+        c01 = values[i, j + 1, k] + z * (values[i, j + 1, k + 1] - values[i, j + 1, k])
+        c10 = values[i + 1, j, k] + z * (values[i + 1, j, k + 1] - values[i + 1, j, k])
+        c11 = values[i + 1, j + 1, k] + z * (values[i + 1, j + 1, k + 1] - values[i + 1, j + 1, k])
+        c0 = c00 + y * (c01 - c00)
+        c1 = c10 + y * (c11 - c10)
+        return (c0 + x * (c1 - c0))[()]
+
+
+def check_latency_surface(surface, num_points=200, n_limit=100, k_limit=100, seed=None):
+    """Compare the surface with `analytical_latency_result` at random points.
+
+    Returns:
+        Dict with the maximum and mean absolute and relative errors.
+    """
+    rng = np.random.default_rng(seed)
+    omega, L, lambda_ = (rng.uniform(low, high, num_points)
+                         for low, high in zip(surface.lows, surface.highs))
+
+    expected = analytical_latency_result((L, omega, lambda_), n_limit, k_limit)
+    interpolated = surface(omega, L, lambda_)
+    absolute_error = np.abs(interpolated - expected)
+    relative_error = absolute_error / np.abs(expected)
+
+    return {
+        "max_abs_error": np.max(absolute_error),
+        "mean_abs_error": np.mean(absolute_error),
+        "max_rel_error": np.max(relative_error),
+        "mean_rel_error": np.mean(relative_error),
+    }
+
+
+def main():
+    # Imported here because the env itself imports this module.
+    from lib.bluetooth_discovery_env import (OMEGA_LOW, OMEGA_HIGH, L_LOW, L_HIGH,
+                                             LAMBDA_LOW, LAMBDA_HIGH)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Precompute the latency surface')
+    build.add_argument('--path', required=True)
+    build.add_argument('--shape', type=int, nargs=3, default=(37, 46, 37))
+    build.add_argument('--simulation', action='store_true', help='Also store the simulated latency')
+    build.add_argument('--trials', type=int, default=10000)
+    build.add_argument('--seed', type=int)
+
+    check = subparsers.add_parser('check', help='Report the interpolation error')
+    check.add_argument('--path', required=True)
+    check.add_argument('--points', type=int, default=200)
+    check.add_argument('--method', choices=['linear', 'cubic'], default='linear')
+    check.add_argument('--seed', type=int)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_latency_surface(args.path, (OMEGA_LOW, OMEGA_HIGH), (L_LOW, L_HIGH), (LAMBDA_LOW, LAMBDA_HIGH),
+                              shape=tuple(args.shape), include_simulation=args.simulation,
+                              num_trials=args.trials, seed=args.seed)
+    else:
+        errors = check_latency_surface(LatencySurface(args.path, method=args.method),
+                                       num_points=args.points, seed=args.seed)
+        for name, value in errors.items():
+            print(f'{name}: {value:.6g}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
+from collections import OrderedDict
+
 import numpy as np
-from scipy.special import gammaln, gammainc
+from scipy.special import gammaln, gammainc, gammaincc, ndtri
 from scipy.integrate import quad
 from scipy.optimize import minimize
 
+from lib import instrumentation
+
 def erlang_pdf(x, k, lambd):
     """
     Compute the Erlang PDF at x using logarithms to avoid overflow.
@@ -24,6 +28,31 @@ def erlang_k_cdf(k, lam, t):
     """Calculate the CDF of the Erlang-k distribution at time t."""
     return gammainc(k, lam * t)
 
+def summed_erlang_k_cdf(k_limit, lam, t):
+    """
+    Calculate the sum of the Erlang-k CDFs for k = 1..k_limit at time t.
+
+    The Erlang-k CDF is the probability that a Poisson(lam * t) count N is at
+    least k, so the sum is E[min(N, k_limit)], which has the closed form
+    lam * t * P(N <= k_limit - 2) + k_limit * P(N >= k_limit) and needs no
+    loop over k. k_limit may be an array broadcasting against lam * t, and
+    k_limit = 0 gives the empty sum.
+    """
+    x = lam * t
+    if np.ndim(k_limit) == 0:
+        if instrumentation.enabled:
+            instrumentation.count("math.gammainc_evaluations", np.size(x) * (1 if k_limit <= 1 else 2))
+        if k_limit <= 1:
+            return k_limit * gammainc(1, x)
+        return x * gammaincc(k_limit - 1, x) + k_limit * gammainc(k_limit, x)
+
+    k_limit = np.asarray(k_limit)
+    if instrumentation.enabled:
+        instrumentation.count("math.gammainc_evaluations", 2 * np.broadcast(k_limit, x).size)
+    # gammaincc(0, 0) is nan, the first term vanishes for k_limit <= 1 anyway
+    return np.where(k_limit > 1, x * gammaincc(np.maximum(k_limit - 1, 1), x), 0) + \
+        k_limit * gammainc(np.maximum(k_limit, 1), x)
+
 def erlang_k_interval_probability(k, lam, nL, delta):
     """Calculate the probability that the kth event happens in the interval [nL - delta, nL + delta]."""
     # TODO: Make sure the range is correct, I feel like
@@ -38,42 +67,285 @@ def poisson_pmf(k, nL, lambda_):
     return np.exp(log_pmf)
 
 def probability_of_matching_with_beacon_n(k_limit, interval, omega, rate, n):
-    sum_k = 0
-    for k in range(1, k_limit + 1):
-        # erlang_pdf_res, error = quad(erlang_pdf, lower_bound, upper_bound, args=(k, rate))
-        erlang_pdf_res = erlang_k_interval_probability(k, rate, n * interval, omega/2)
-        sum_k +=  erlang_pdf_res
-    return sum_k
-
-def analytical_latency_result(params, n_limit, k_limit):
+    k = np.arange(1, k_limit + 1)
+    # erlang_pdf_res, error = quad(erlang_pdf, lower_bound, upper_bound, args=(k, rate))
+    erlang_pdf_res = erlang_k_interval_probability(k, rate, n * interval, omega/2)
+    return np.sum(erlang_pdf_res)
+
+def beacon_hit_probability(rate, omega):
+    """
+    Compute the probability that at least one scan falls inside a beacon window.
+
+    Scans are a Poisson process, so a window of length omega holds no scan
+    with probability exp(-rate * omega). Beacons whose windows do not overlap
+    (omega <= L) are hit independently.
+    """
+    return -np.expm1(-np.asarray(rate, dtype=float) * omega)[()]
+
+def beacon_match_probabilities(interval, omega, rate, n_limit, k_limit):
+    """
+    Compute the probability P_n of matching with each of the beacons 1..n_limit.
+
+    The Erlang interval probabilities of all k in 1..k_limit are summed in
+    closed form, as the difference of `summed_erlang_k_cdf` at the two edges
+    of every beacon, instead of over a (k, n) grid.
+
+    Parameters:
+    interval (float or array): The advertising interval L.
+    omega (float or array): The beacon duration.
+    rate (float or array): The scanning rate lambda.
+    n_limit (int): The number of beacons to consider.
+    k_limit (int): The number of scanning events to consider per beacon.
+
+    Returns:
+    array: P_n with shape broadcast(interval, omega, rate) + (n_limit,).
+    """
+    interval, omega, rate = (np.asarray(value, dtype=float)[..., None]
+                             for value in (interval, omega, rate))
+    n = np.arange(1, n_limit + 1)
+    return summed_erlang_k_cdf(k_limit, rate, n * interval + omega/2) - \
+        summed_erlang_k_cdf(k_limit, rate, n * interval - omega/2)
+
+class ErlangTableCache:
+    """
+    A bounded LRU cache of the beacon match probabilities P_n.
+
+    The cache keeps the P_n vectors keyed by quantized (rate, L, omega,
+    n_limit, k_limit) and evicts the least recently used ones. The vectors
+    are returned read-only, as they are shared by every caller of the key.
+    """
+    def __init__(self, maxsize=1024, quantum=1e-8) -> None:
+        """This constructor initializes an empty cache.
+
+        Args:
+            maxsize (int): The maximum number of P_n vectors kept.
+            quantum (float, optional): Grid step the rate, L and omega are
+                rounded to before lookup, so that parameters differing only by
+                floating-point noise share entries. The default is well below
+                the finite-difference steps of `lib.optimization`. None caches
+                the exact parameter values.
+        """
+        self.maxsize = maxsize
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self._probabilities = OrderedDict()
+
+    def quantize(self, value):
+        value = float(value)
+        if self.quantum is not None:
+            value = round(value / self.quantum) * self.quantum
+        return value
+
+    def beacon_match_probabilities(self, interval, omega, rate, n_limit, k_limit):
+        """Return P_n of one parameter point, see `beacon_match_probabilities`."""
+        interval, omega, rate = self.quantize(interval), self.quantize(omega), self.quantize(rate)
+        key = (rate, interval, omega, n_limit, k_limit)
+
+        if key in self._probabilities:
+            self.hits += 1
+            if instrumentation.enabled:
+                instrumentation.count("math.erlang_cache.hits")
+            self._probabilities.move_to_end(key)
+            return self._probabilities[key]
+
+        self.misses += 1
+        if instrumentation.enabled:
+            instrumentation.count("math.erlang_cache.misses")
+        P_n = beacon_match_probabilities(interval, omega, rate, n_limit, k_limit)
+        P_n.setflags(write=False)
+        self._probabilities[key] = P_n
+        if len(self._probabilities) > self.maxsize:
+            self._probabilities.popitem(last=False)
+        return P_n
+
+    def cache_info(self):
+        """Return the hit/miss counters and the size of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._probabilities),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        self._probabilities.clear()
+        self.hits = self.misses = 0
+
+def analytical_latency_result(params, n_limit, k_limit, include_tail=False, cache=None):
+    """
+    Compute the expected discovery latency of the analytical model.
+
+    The entries of `params` may be arrays, in which case the latency of every
+    (interval, omega, rate) point is computed in one call. Memory grows with
+    the number of points times n_limit, so very large batches should be
+    evaluated in chunks.
+
+    At low rates most of the probability mass lies beyond n_limit beacons and
+    the truncated sum underestimates the latency by orders of magnitude, which
+    optimizers readily exploit. `include_tail` replaces the beacons after
+    n_limit, and those whose scans exceed k_limit, by a geometric tail.
+
+    Parameters:
+    params (tuple): The (interval, omega, rate) parameters.
+    n_limit (int): The number of beacons to consider.
+    k_limit (int): The number of scanning events to consider per beacon.
+    include_tail (bool): Estimate the latency of the truncated beacons.
+    cache (ErlangTableCache, optional): Look the P_n of every point up in this cache.
+
+    Returns:
+    float or array: The expected latency, with the broadcast shape of params.
+    """
     interval, omega, rate = params
-    
-    P_n = []
-    
-    for n in range(1, n_limit + 1):
-        lower_bound = n * interval - omega/2
-        upper_bound = n * interval + omega/2
+    if instrumentation.enabled:
+        instrumentation.count("math.analytical_points", np.broadcast(interval, omega, rate).size)
 
-        sum_k = probability_of_matching_with_beacon_n(k_limit, interval, omega, rate, n) 
+    if cache is None:
+        P_n = beacon_match_probabilities(interval, omega, rate, n_limit, k_limit)
+    else:
+        points = np.broadcast(interval, omega, rate)
+        P_n = np.array([cache.beacon_match_probabilities(*point, n_limit, k_limit)
+                        for point in points]).reshape(points.shape + (n_limit,))
 
-        P_n.append(sum_k)
+    # Probability that none of the previous beacons matched
+    survival = np.cumprod(1 - P_n, axis=-1)
+    probability_of_no_match = np.concatenate(
+        [np.ones_like(survival[..., :1]), survival[..., :-1]], axis=-1)
+    bernouli_probabilities = P_n * probability_of_no_match
 
-    latency = 0
-    bernouli_probabilities = []
-    for n in range(n_limit):
-        time_duration = (n + 1) * interval
-        probability_of_no_match = np.prod([1 - P_n[i] for i in range(n)])
-        bernouli_prob =  P_n[n] * probability_of_no_match
-        bernouli_probabilities.append(bernouli_prob)
-        latency += time_duration * bernouli_prob
+    time_duration = np.arange(1, n_limit + 1) * np.asarray(interval, dtype=float)[..., None]
+    latency = np.sum(time_duration * bernouli_probabilities, axis=-1)
+    if include_tail:
+        # Summed over all k, P_n equals lambda * omega, the expected number of
+        # scans in a window. The sum over the leading beacons that k_limit
+        # still covers is kept and the rest is replaced by a geometric tail
+        # of beacons matching with that probability each. lambda * omega is
+        # not clipped to 1: with overlapping windows (omega > L) the windows
+        # hold more than one scan each and the tail is shorter than a beacon.
+        match_probability = np.maximum(np.asarray(rate, dtype=float) * omega, 1e-12)[..., None]
+        complete = np.cumprod(P_n >= 0.99 * match_probability, axis=-1).astype(bool)
+        n_complete = np.sum(complete, axis=-1)
+        head_latency = np.sum(np.where(complete, time_duration * bernouli_probabilities, 0), axis=-1)
+        head_survival = np.where(n_complete > 0,
+                                 np.take_along_axis(survival, np.maximum(n_complete - 1, 0)[..., None], axis=-1)[..., 0],
+                                 1.0)
+        latency = head_latency + head_survival * np.asarray(interval, dtype=float) * \
+            (n_complete + 1 / match_probability[..., 0])
     # print(f'latency: {latency}')
-    # print(f'sum (P_n): {sum(bernouli_probabilities)}')
+    # print(f'sum (P_n): {np.sum(bernouli_probabilities, axis=-1)}')
     
     # Print params if latency is nan
-    if np.isnan(latency):
+    if np.any(np.isnan(latency)):
         print('nan found:')
         print(params)
-    return latency
+    return latency[()]
+
+def adaptive_beacon_match_probabilities(interval, omega, rate, n, tol=1e-10):
+    """
+    Compute P_n for the beacons `n` summing only the k that matter.
+
+    The kth scanning event can only land in the window [nL - omega/2, nL + omega/2]
+    when k lies between the Poisson quantiles of lambda * (nL - omega/2) and
+    lambda * (nL + omega/2), so only those k are summed. The quantiles are
+    bounded by the normal approximation widened by z^2, and the sum over the
+    k range is the difference of `summed_erlang_k_cdf` at its two ends.
+    Summed over all k the interval probabilities add up to lambda * omega, the
+    expected number of scans in the window, which gives the exact mass left
+    out by the truncation.
+
+    Parameters:
+    interval (float): The advertising interval L.
+    omega (float): The beacon duration.
+    rate (float): The scanning rate lambda.
+    n (array): The beacon indices.
+    tol (float): The Poisson tail mass allowed on each side of the k range.
+
+    Returns:
+    tuple: (P_n, k_truncation_error, k_terms) with the probabilities, the
+    mass left out of each P_n and the number of k summed per beacon.
+    """
+    n = np.asarray(n)
+    lower = np.maximum(n * interval - omega/2, 0)
+    upper = n * interval + omega/2
+
+    z = -ndtri(tol)
+    mean_lower, mean_upper = rate * lower, rate * upper
+    k_lower = np.maximum(np.floor(mean_lower - z * np.sqrt(mean_lower) - z**2), 1).astype(int)
+    k_upper = np.ceil(mean_upper + z * np.sqrt(mean_upper) + z**2).astype(int) + 1
+    k_terms = k_upper - k_lower + 1
+
+    P_n = (summed_erlang_k_cdf(k_upper, rate, upper) - summed_erlang_k_cdf(k_lower - 1, rate, upper)) - \
+        (summed_erlang_k_cdf(k_upper, rate, lower) - summed_erlang_k_cdf(k_lower - 1, rate, lower))
+    k_truncation_error = np.maximum(rate * (upper - lower) - P_n, 0)
+    return P_n, k_truncation_error, k_terms
+
+def adaptive_latency_result(params, tol=1e-8, max_n=100000, chunk_size=16):
+    """
+    Compute the expected latency of the analytical model with adaptive truncation.
+
+    Instead of fixed n_limit/k_limit, beacons are added in chunks of growing
+    size until the probability of not having matched any of them drops below
+    `tol`, and for every beacon only the k near lambda * nL are summed (see
+    `adaptive_beacon_match_probabilities`).
+
+    Parameters:
+    params (tuple): The (interval, omega, rate) parameters.
+    tol (float): The probability mass that may be left out by the truncation.
+    max_n (int): Upper bound on the number of beacons considered.
+    chunk_size (int): Number of beacons evaluated in the first vectorized
+    step, doubled on every following step.
+
+    Returns:
+    dict: The latency, the truncation error (probability mass not accounted
+    for, from both the k and the n truncation), an estimate of the resulting
+    latency error, the number of beacons used and the largest number of k
+    summed for one beacon.
+    """
+    if not 0 < tol < 1:
+        raise ValueError(f'tol must lie in (0, 1), got {tol}')
+    if max_n < 1:
+        raise ValueError(f'max_n must be at least 1, got {max_n}')
+    interval, omega, rate = params
+    if instrumentation.enabled:
+        instrumentation.count("math.adaptive_points")
+
+    latency = 0
+    probability_of_no_match = 1.0
+    k_truncation_error = 0
+    k_latency_error = 0
+    max_k_terms = 0
+    n_limit = 0
+
+    while n_limit < max_n and abs(probability_of_no_match) >= tol:
+        n = np.arange(n_limit + 1, min(n_limit + chunk_size, max_n) + 1)
+        P_n, k_error, k_terms = adaptive_beacon_match_probabilities(
+            interval, omega, rate, n, tol=tol * 1e-2)
+
+        survival = probability_of_no_match * np.cumprod(1 - P_n)
+        previous_survival = np.concatenate([[probability_of_no_match], survival[:-1]])
+        latency += np.sum(n * interval * P_n * previous_survival)
+        k_truncation_error += np.sum(np.abs(previous_survival) * k_error)
+        k_latency_error += np.sum(n * interval * np.abs(previous_survival) * k_error)
+
+        probability_of_no_match = survival[-1]
+        max_k_terms = max(max_k_terms, np.max(k_terms))
+        n_limit = n[-1]
+        chunk_size *= 2
+
+    # The beacons after n_limit match with roughly the last P_n each, so the
+    # latency they would add is that of a geometric tail.
+    n_latency_error = abs(probability_of_no_match) * interval * (n_limit + 1 / max(P_n[-1], tol))
+
+    return {
+        "latency": latency,
+        "truncation_error": abs(probability_of_no_match) + k_truncation_error,
+        "latency_error": n_latency_error + k_latency_error,
+        "n_limit": int(n_limit),
+        "k_terms": int(max_k_terms),
+    }
 
 def average_energy_consumption(params):
     L, omega, lambda_ = params
@@ -101,13 +373,27 @@ def energy_constraint(params, E_t, E_budget, n_max, k_max):
     
     return E_budget - average_energy_consumption(params)
 
-def minimize_latency(n_limit, k_limit):
-    # Parameters and bounds
+def minimize_latency(n_limit, k_limit, E_budget=20.0, bounds=((2.0, 10.0), (0.01, 1.0), (0.01, 1.0)),
+                     initial_guess=None, include_tail=False, verbose=False):
+    """
+    Minimize the analytical latency with SLSQP from one start within an energy budget.
+
+    See `lib.optimization.optimize_latency` for the multi-start version.
+
+    Parameters:
+    n_limit (int): The number of beacons to consider.
+    k_limit (int): The number of scanning events to consider per beacon.
+    E_budget (float): The upper bound of `average_energy_consumption`.
+    bounds (sequence): The (low, high) bounds of L, omega and lambda.
+    initial_guess (sequence, optional): The start, by default the center of the bounds.
+    include_tail (bool): See `analytical_latency_result`.
+    verbose (bool): Print the optimal parameters or the failure message.
+
+    Returns:
+    OptimizeResult: The result of `scipy.optimize.minimize`.
+    """
+    # Parameters
     E_t = 1.0 
-    E_budget = 20.0
-    L_bounds = (2.0, 10.0)
-    omega_bounds = (0.01, 1.0)
-    lambda_bounds = (0.01, 1.0)
 
     # Define the constraints in the form required by scipy.optimize.minimize
     constraints = ({
@@ -116,22 +402,23 @@ def minimize_latency(n_limit, k_limit):
         'args': (E_t, E_budget, n_limit, k_limit)
     })
 
-    initial_guess = [1.0, 0.1, 0.5]
-    # Define the bounds in the form required by scipy.optimize.minimize
-    bounds = [L_bounds, omega_bounds, lambda_bounds]
+    if initial_guess is None:
+        initial_guess = np.mean(bounds, axis=1)
     
     result = minimize(analytical_latency_result, 
                       x0=initial_guess,
-                      args=(n_limit, k_limit),
+                      args=(n_limit, k_limit, include_tail),
                       bounds=bounds,
                       constraints=constraints,
                       method='SLSQP')
     
     # Output the results
-    if result.success:
-        optimal_params = result.x
-        print(f"Optimal L: {optimal_params[0]}")
-        print(f"Optimal omega: {optimal_params[1]}")
-        print(f"Optimal lambda: {optimal_params[2]}")
-    else:
-        print("Optimization failed:", result.message)
+    if verbose:
+        if result.success:
+            optimal_params = result.x
+            print(f"Optimal L: {optimal_params[0]}")
+            print(f"Optimal omega: {optimal_params[1]}")
+            print(f"Optimal lambda: {optimal_params[2]}")
+        else:
+            print("Optimization failed:", result.message)
+    return result
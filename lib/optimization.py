@@ -0,0 +1,181 @@
+"""Multi-start constrained minimization of the analytical latency.
+
+The latency is minimized over (L, omega, lambda) within bounds, subject to
+`average_energy_consumption` staying within an energy budget. SLSQP is
+started from the points of a scrambled Sobol sequence, and the starts run in
+a process pool. The objective and its central-difference gradient are
+evaluated in one vectorized call of `analytical_latency_result`, and the
+starts of several budgets can be run together to trace the Pareto front of
+latency against energy.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.optimize import minimize
+from scipy.stats import qmc
+
+from lib.math import analytical_latency_result, average_energy_consumption
+from lib.pareto import pareto_indices
+
+DEFAULT_BOUNDS = ((2.0, 10.0), (0.01, 1.0), (0.01, 1.0))
+
+
+def central_difference_points(x, step):
+    """Return x followed by x + h e_i and x - h e_i for every coordinate, shape (2d + 1, d)."""
+    x = np.asarray(x, dtype=float)
+    steps = np.diag(step * np.maximum(1.0, np.abs(x)))
+    return np.vstack([x, x + steps, x - steps]), np.diag(steps)
+
+
+class BatchedFunction:
+    """
+    A function of a parameter point whose value and gradient come from one vectorized call.
+
+    The function is evaluated at the point and at the 2d central-difference
+    points together, and the last result is cached, so SLSQP asking for the
+    value and then the gradient of the same point costs a single call.
+    """
+    def __init__(self, function, step=1e-6) -> None:
+        """This constructor wraps the function.
+
+        Args:
+            function (callable): Function of a tuple of d parameter arrays,
+                e.g. `average_energy_consumption`
+            step (float): Relative step of the central differences
+        """
+        self.function = function
+        self.step = step
+        self.num_calls = 0
+        self._x = None
+        self._value = None
+        self._gradient = None
+
+    def _evaluate(self, x):
+        if self._x is not None and np.array_equal(x, self._x):
+            return
+        points, steps = central_difference_points(x, self.step)
+        values = np.asarray(self.function(tuple(points.T)), dtype=float)
+        self.num_calls += 1
+
+        d = len(steps)
+        self._x = np.array(x, dtype=float)
+        self._value = values[0]
+        self._gradient = (values[1:d + 1] - values[d + 1:]) / (2 * steps)
+
+    def value(self, x):
+        self._evaluate(x)
+        return self._value
+
+    def gradient(self, x):
+        self._evaluate(x)
+        return self._gradient
+
+
+def sobol_starts(bounds, num_starts, seed=None):
+    """Return `num_starts` scrambled Sobol points scaled to `bounds`, shape (num_starts, d)."""
+    lows, highs = np.array(bounds, dtype=float).T
+    sampler = qmc.Sobol(d=len(bounds), scramble=True, seed=seed)
+    # Sobol points are balanced in powers of two, so draw the next power and keep the first ones
+    points = sampler.random_base2(int(np.ceil(np.log2(max(num_starts, 1)))))[:num_starts]
+    return qmc.scale(points, lows, highs)
+
+
+def run_start(x0, energy_budget, bounds, n_limit=100, k_limit=100, include_tail=True, step=1e-6):
+    """
+    Run SLSQP from one start point.
+
+    Returns:
+        Dict with the start, the solution, its latency and energy, the SLSQP
+        status and the wall time of the start.
+    """
+    start_time = time.perf_counter()
+    latency = BatchedFunction(lambda params: analytical_latency_result(params, n_limit, k_limit, include_tail), step)
+    energy = BatchedFunction(average_energy_consumption, step)
+
+    result = minimize(latency.value, x0=x0, jac=latency.gradient, bounds=bounds, method='SLSQP',
+                      constraints={
+                          'type': 'ineq',
+                          'fun': lambda x: energy_budget - energy.value(x),
+                          'jac': lambda x: -energy.gradient(x),
+                      })
+
+    return {
+        "x0": np.asarray(x0, dtype=float),
+        "x": result.x,
+        "latency": float(latency.value(result.x)),
+        "energy": float(average_energy_consumption(tuple(result.x))),
+        "energy_budget": energy_budget,
+        "success": bool(result.success),
+        "message": result.message,
+        "num_iterations": result.nit,
+        "num_evaluations": latency.num_calls,
+        "time": time.perf_counter() - start_time,
+    }
+
+
+def _best_start(starts, energy_budget, tol=1e-6):
+    """The start with the lowest latency among those that succeeded within the budget."""
+    feasible = [start for start in starts if start["success"] and start["energy"] <= energy_budget + tol]
+    return min(feasible or starts, key=lambda start: start["latency"])
+
+
+def optimize_latency(energy_budget, bounds=DEFAULT_BOUNDS, energy_budgets=None, num_starts=16,
+                     n_limit=100, k_limit=100, include_tail=True, max_workers=None, seed=None):
+    """
+    Minimize the analytical latency within an energy budget from many starts.
+
+    Args:
+        energy_budget (float): The upper bound of `average_energy_consumption`.
+        bounds (sequence): The (low, high) bounds of L, omega and lambda.
+        energy_budgets (sequence, optional): Further budgets whose optima form
+            the Pareto front; their starts run in the same pool.
+        num_starts (int): The number of Sobol start points per budget.
+        n_limit (int): The number of beacons of the analytical model.
+        k_limit (int): The number of scanning events of the analytical model.
+        include_tail (bool): Add the latency beyond n_limit beacons, without
+            it the optimum drifts to the lowest rates where the truncated
+            model underestimates the latency the most.
+        max_workers (int, optional): The number of worker processes, 1 runs
+            the starts in this process.
+        seed (int, optional): Seed of the Sobol scrambling.
+
+    Returns:
+        Dict with the optimal "x", "latency", "energy" and "success", the
+        starts of `energy_budget` under "starts" and of every budget under
+        "budget_starts", the optima of the budgets that no other budget's
+        optimum beats in both latency and energy, sorted by energy, under
+        "pareto_front" and the total wall time under "time".
+    """
+    start_time = time.perf_counter()
+    budgets = [energy_budget] + [budget for budget in (energy_budgets or []) if budget != energy_budget]
+    x0s = sobol_starts(bounds, num_starts, seed=seed)
+    jobs = [(x0, budget) for budget in budgets for x0 in x0s]
+
+    if max_workers == 1:
+        starts = [run_start(x0, budget, bounds, n_limit, k_limit, include_tail) for x0, budget in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_start, x0, budget, bounds, n_limit, k_limit, include_tail)
+                       for x0, budget in jobs]
+            starts = [future.result() for future in futures]
+
+    optima = [_best_start(starts[i * num_starts:(i + 1) * num_starts], budget)
+              for i, budget in enumerate(budgets)]
+    optimum = optima[0]
+    # A larger budget can end in a worse local optimum, which is dominated
+    front = pareto_indices([optimum["latency"] for optimum in optima], [optimum["energy"] for optimum in optima])
+    pareto_front = [{key: optima[i][key] for key in ("energy_budget", "x", "latency", "energy")}
+                    for i in front]
+
+    return {
+        "x": optimum["x"],
+        "latency": optimum["latency"],
+        "energy": optimum["energy"],
+        "success": optimum["success"],
+        "starts": starts[:num_starts],
+        "pareto_front": pareto_front,
+        "budget_starts": {budget: starts[i * num_starts:(i + 1) * num_starts]
+                          for i, budget in enumerate(budgets)},
+        "time": time.perf_counter() - start_time,
+    }
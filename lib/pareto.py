@@ -0,0 +1,216 @@
+"""Latency-energy Pareto front of the (L, omega, lambda) parameter space.
+
+Parameter points are drawn from a scrambled Sobol sequence within bounds and
+their latency and `average_energy_consumption` are evaluated in chunks. Only
+the non-dominated points of every chunk are kept and merged into the running
+front, so memory does not grow with the number of points. The front is sorted
+by energy with strictly decreasing latency, so the best latency for an energy
+budget is a binary search.
+
+The analytical model costs about 0.1 ms per point with the default limits;
+for many millions of points evaluate a precomputed `LatencySurface` instead
+(see `lib.latency_surface`):
+
+    python -m lib.pareto --points 1000000 --surface surfaces/latency --out front.npz
+"""
+import argparse
+import functools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from scipy.stats import qmc
+
+from lib.math import analytical_latency_result, average_energy_consumption
+
+
+def pareto_indices(latency, energy):
+    """
+    Find the points that no other point beats in both latency and energy.
+
+    The points are sorted by energy, ties by latency, and a point is kept if
+    its latency is below that of every point before it: a 2-D skyline in
+    O(n log n).
+
+    Returns:
+    array: The indices of the front, in order of increasing energy.
+    """
+    latency = np.asarray(latency, dtype=float)
+    energy = np.asarray(energy, dtype=float)
+    valid = np.flatnonzero(~np.isnan(latency) & ~np.isnan(energy))
+    order = valid[np.lexsort((latency[valid], energy[valid]))]
+
+    sorted_latency = latency[order]
+    best_before = np.concatenate([[np.inf], np.minimum.accumulate(sorted_latency)[:-1]])
+    return order[sorted_latency < best_before]
+
+
+class ParetoFront:
+    """
+    A latency-energy Pareto front sorted by increasing energy.
+    """
+    def __init__(self, params, latency, energy) -> None:
+        """This constructor stores the front.
+
+        Args:
+            params (array): The (L, omega, lambda) of every point, shape (m, 3)
+            latency (array): The latency of every point, decreasing
+            energy (array): The energy of every point, increasing
+        """
+        self.params = np.asarray(params, dtype=float).reshape(-1, 3)
+        self.latency = np.asarray(latency, dtype=float)
+        self.energy = np.asarray(energy, dtype=float)
+
+    def __len__(self):
+        return len(self.latency)
+
+    def merge(self, params, latency, energy):
+        """Return the front of this front and further points."""
+        params = np.concatenate([self.params, np.asarray(params, dtype=float).reshape(-1, 3)])
+        latency = np.concatenate([self.latency, latency])
+        energy = np.concatenate([self.energy, energy])
+        front = pareto_indices(latency, energy)
+        return ParetoFront(params[front], latency[front], energy[front])
+
+    def best_latency(self, energy_budget):
+        """
+        Find the lowest latency whose energy is within the budget.
+
+        Args:
+            energy_budget (float or array): The upper bound of the energy.
+
+        Returns:
+            Tuple of (latency, energy, params), with nan where no point of the
+            front fits the budget.
+        """
+        index = np.searchsorted(self.energy, energy_budget, side='right') - 1
+        found = index >= 0
+        index = np.maximum(index, 0)
+        if len(self) == 0:
+            nan = np.full(np.shape(energy_budget), np.nan)
+            return nan[()], nan[()], np.full(np.shape(energy_budget) + (3,), np.nan)
+
+        latency = np.where(found, self.latency[index], np.nan)
+        energy = np.where(found, self.energy[index], np.nan)
+        params = np.where(np.asarray(found)[..., None], self.params[index], np.nan)
+        return latency[()], energy[()], params
+
+    def save(self, path):
+        """Write the front to a `.npz` file."""
+        np.savez(path, params=self.params, latency=self.latency, energy=self.energy)
+
+    @classmethod
+    def load(cls, path):
+        """Read a front written by `save`."""
+        with np.load(path) as data:
+            return cls(data['params'], data['latency'], data['energy'])
+
+
+@functools.lru_cache(maxsize=None)
+def _load_surface(path):
+    # One memory-mapped surface per process
+    from lib.latency_surface import LatencySurface
+    return LatencySurface(path)
+
+
+def evaluate_chunk(params, n_limit=100, k_limit=100, surface_path=None):
+    """
+    Evaluate the latency and energy of a chunk of points and keep its front.
+
+    Args:
+        params (array): The (L, omega, lambda) points, shape (m, 3).
+        n_limit (int): The number of beacons of the analytical model.
+        k_limit (int): The number of scanning events of the analytical model.
+        surface_path (str, optional): Interpolate this latency surface
+            instead of evaluating the analytical model.
+
+    Returns:
+        Tuple of (params, latency, energy) of the front of the chunk.
+    """
+    L, omega, lambda_ = params.T
+    if surface_path is not None:
+        latency = _load_surface(surface_path)(omega, L, lambda_)
+    else:
+        latency = analytical_latency_result((L, omega, lambda_), n_limit, k_limit, include_tail=True)
+    energy = average_energy_consumption((L, omega, lambda_))
+
+    front = pareto_indices(latency, energy)
+    return params[front], latency[front], energy[front]
+
+
+def explore_pareto_front(num_points, bounds, chunk_size=256, n_limit=100, k_limit=100,
+                         surface_path=None, max_workers=1, seed=None):
+    """
+    Evaluate `num_points` Sobol points within `bounds` and return their Pareto front.
+
+    Args:
+        num_points (int): The number of parameter points.
+        bounds (sequence): The (low, high) bounds of L, omega and lambda.
+        chunk_size (int): The number of points evaluated per vectorized call;
+            the analytical model holds chunk_size * n_limit values.
+        n_limit (int): The number of beacons of the analytical model.
+        k_limit (int): The number of scanning events of the analytical model.
+        surface_path (str, optional): Interpolate this latency surface instead
+            of evaluating the analytical model.
+        max_workers (int): The number of worker processes, 1 evaluates the
+            chunks in this process. At most two chunks per worker are in
+            flight at a time, so memory does not grow with num_points.
+        seed (int, optional): Seed of the Sobol scrambling.
+
+    Returns:
+        ParetoFront: The non-dominated points.
+    """
+    lows, highs = np.array(bounds, dtype=float).T
+    sampler = qmc.Sobol(d=3, scramble=True, seed=seed)
+    front = ParetoFront(np.empty((0, 3)), [], [])
+
+    def chunks():
+        for start in range(0, num_points, chunk_size):
+            size = min(chunk_size, num_points - start)
+            yield qmc.scale(sampler.random(size), lows, highs)
+
+    if max_workers == 1:
+        for params in chunks():
+            front = front.merge(*evaluate_chunk(params, n_limit, k_limit, surface_path))
+        return front
+
+    evaluate = functools.partial(evaluate_chunk, n_limit=n_limit, k_limit=k_limit, surface_path=surface_path)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for params in chunks():
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    front = front.merge(*future.result())
+            pending.add(executor.submit(evaluate, params))
+        for future in wait(pending).done:
+            front = front.merge(*future.result())
+    return front
+
+
+def main():
+    # Imported here because the env depends on optional RL packages.
+    from lib.bluetooth_discovery_env import (OMEGA_LOW, OMEGA_HIGH, L_LOW, L_HIGH,
+                                             LAMBDA_LOW, LAMBDA_HIGH)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--surface', help='Latency surface directory used instead of the analytical model')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', required=True, help='File the front is saved to')
+    parser.add_argument('--budget', type=float, nargs='*', default=[], help='Print the best latency for these budgets')
+    args = parser.parse_args()
+
+    front = explore_pareto_front(args.points, [(L_LOW, L_HIGH), (OMEGA_LOW, OMEGA_HIGH), (LAMBDA_LOW, LAMBDA_HIGH)],
+                                 chunk_size=args.chunk_size, surface_path=args.surface,
+                                 max_workers=args.workers, seed=args.seed)
+    front.save(args.out)
+    print(f'{len(front)} points on the front')
+    for budget in args.budget:
+        latency, energy, params = front.best_latency(budget)
+        print(f'E <= {budget}: latency {latency:.6g} at energy {energy:.6g}, (L, omega, lambda) = {params}')
+
+
+if __name__ == '__main__':
+    main()
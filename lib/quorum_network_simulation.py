@@ -0,0 +1,220 @@
+"""Discovery simulation of a whole network of grid-quorum devices.
+
+Every device runs the grid quorum of `lib.utils`: time is divided into slots,
+which are numbered row by row on an N x N grid, and the device is awake in
+one random row and one random column, i.e. in 2N - 1 of every N^2 slots.
+Devices have their own grid sizes and unsynchronized clocks, and two
+neighbors discover each other in the first slot in which both are awake.
+
+The awake slots of every device are stored as a bitmap packed into uint64
+words, so the first common slot of a pair is one bitwise AND and a search
+for the lowest set bit. Only the pairs within communication range are
+compared; they are found by bucketing the devices into cells of the size of
+the range, which scales with the number of neighbors instead of the square
+of the number of devices.
+"""
+import numpy as np
+
+from lib.fuzzy_logic import get_quorum_size_controller
+from lib.quorum_schedule import WORD_BITS, QuorumSchedule
+
+# Half of the 3 x 3 cell neighborhood, so that every pair of cells is visited once
+_HALF_NEIGHBORHOOD = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def neighbor_pairs(positions, communication_range):
+    """
+    Find all pairs of devices within communication range of each other.
+
+    The devices are bucketed into square cells with a side of the range, so
+    only devices in the same or in adjacent cells are compared.
+
+    Parameters:
+    positions (array): The (x, y) positions of the devices, shape (n, 2).
+    communication_range (float): The maximum distance of neighbors.
+
+    Returns:
+    array: The pairs (i, j) with i < j, shape (num_pairs, 2).
+    """
+    positions = np.asarray(positions, dtype=float)
+    cells = np.floor(positions / communication_range).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # One spare cell on every side, so that neighbor keys never wrap around a row
+    height = cells[:, 1].max() + 3
+    keys = (cells[:, 0] + 1) * height + cells[:, 1] + 1
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    devices = np.arange(len(positions))
+
+    pairs = []
+    for dx, dy in _HALF_NEIGHBORHOOD:
+        neighbor_keys = keys + dx * height + dy
+        lo = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+        hi = np.searchsorted(sorted_keys, neighbor_keys, side='right')
+        counts = hi - lo
+
+        i = np.repeat(devices, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + within]
+        if (dx, dy) == (0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        pairs.append(np.column_stack([np.minimum(i, j), np.maximum(i, j)]))
+
+    pairs = np.concatenate(pairs)
+    distances = np.linalg.norm(positions[pairs[:, 0]] - positions[pairs[:, 1]], axis=1)
+    return pairs[distances <= communication_range]
+
+
+def slot_activity_bitmaps(schedules, offsets, horizon, max_chunk_elements=2**24):
+    """
+    Pack the awake slots of every device in [0, horizon) into uint64 words.
+
+    Bit b of word w of a device is set if the device is awake in slot
+    64 * w + b of the common clock.
+
+    Parameters:
+    schedules (list): The `QuorumSchedule` of every device.
+    offsets (array): The slot of its cycle every device starts in.
+    horizon (int): The number of slots, a multiple of 64.
+
+    Returns:
+    array: The bitmaps, shape (n, horizon // 64), dtype uint64.
+    """
+    num_devices = len(schedules)
+    bitmaps = np.empty((num_devices, horizon // WORD_BITS), dtype=np.uint64)
+    chunk_size = max(1, max_chunk_elements // horizon)
+
+    for start in range(0, num_devices, chunk_size):
+        stop = min(start + chunk_size, num_devices)
+        awake = np.empty((stop - start, horizon), dtype=bool)
+        for i in range(start, stop):
+            awake[i - start] = schedules[i].awake_slots(offsets[i], horizon)
+        bitmaps[start:stop] = np.packbits(awake, axis=1, bitorder='little').view('<u8')
+    return bitmaps
+
+
+def first_common_slots(bitmaps, pairs, max_chunk_elements=2**22):
+    """
+    Find the first slot in which both devices of every pair are awake.
+
+    Returns:
+    array: The first common slot of every pair, nan if there is none within
+    the horizon of the bitmaps.
+    """
+    num_words = bitmaps.shape[1]
+    chunk_size = max(1, max_chunk_elements // num_words)
+    slots = np.full(len(pairs), np.nan)
+
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        common = bitmaps[chunk[:, 0]] & bitmaps[chunk[:, 1]]
+        nonzero = common != 0
+        found = nonzero.any(axis=1)
+        word_index = nonzero.argmax(axis=1)
+        words = common[np.arange(len(chunk)), word_index]
+        # Isolate the lowest set bit; it is a power of two, so its log2 is exact
+        lowest_bit = words & (~words + np.uint64(1))
+        bit_index = np.log2(np.where(found, lowest_bit, 1).astype(float))
+        slots[start:start + chunk_size] = np.where(found, word_index * WORD_BITS + bit_index, np.nan)
+    return slots
+
+
+class QuorumNetworkSimulation:
+    """
+    A class to represent the neighbor discovery of a network of grid-quorum devices.
+    """
+    def __init__(self, num_devices, area_size, communication_range, grid_sizes=None,
+                 battery_levels=None, horizon=None) -> None:
+        """This constructor initializes the network.
+
+        Args:
+            num_devices (int): The number of devices
+            area_size (float): The side of the square area the devices are placed in
+            communication_range (float): The maximum distance of neighbors
+            grid_sizes (int or array, optional): The quorum grid size of every device
+            battery_levels (array, optional): Battery levels in percent; the grid
+                sizes are then recommended by the fuzzy controller. Random levels
+                are drawn if neither grid sizes nor battery levels are given.
+            horizon (int, optional): The number of slots searched with the
+                bitmaps, by default twice the longest quorum cycle; pairs
+                without a common slot within it are solved exactly
+        """
+        self.num_devices = num_devices
+        self.area_size = area_size
+        self.communication_range = communication_range
+        self.grid_sizes = grid_sizes
+        self.battery_levels = battery_levels
+        self.horizon = horizon
+
+    def _grid_sizes(self, rng):
+        if self.grid_sizes is not None:
+            return np.broadcast_to(np.asarray(self.grid_sizes, dtype=np.int64), (self.num_devices,))
+
+        battery_levels = self.battery_levels
+        if battery_levels is None:
+            battery_levels = rng.integers(0, 101, self.num_devices)
+        # All devices advertise their presence; the traffic load is not used by the rules
+        quorum_sizes = get_quorum_size_controller().compute_batch(battery_levels, 0, 0)
+        return np.maximum(quorum_sizes, 1).astype(np.int64)
+
+    def run(self, rng=None):
+        """
+        Place the devices, draw their quorums and find the discovery time of every neighbor pair.
+
+        Args:
+            rng: Seed or `np.random.Generator` of the simulation
+
+        Returns:
+            Dict with the neighbor pairs, their discovery times in slots (nan
+            if the quorums never overlap) and summary statistics of the
+            network-wide discovery time distribution. The
+            "network_discovery_time", the slot by which every pair has met,
+            is nan when any pair never meets; "undiscovered_fraction" tells
+            how many pairs that are.
+        """
+        rng = np.random.default_rng(np.random.randint(2**31) if rng is None else rng)
+
+        grid_sizes = self._grid_sizes(rng)
+        positions = rng.uniform(0, self.area_size, size=(self.num_devices, 2))
+        rows = rng.integers(0, grid_sizes)
+        columns = rng.integers(0, grid_sizes)
+        offsets = rng.integers(0, grid_sizes**2)
+
+        # Devices with the same quorum share one schedule object
+        quorums = {}
+        schedules = []
+        for quorum in zip(grid_sizes.tolist(), rows.tolist(), columns.tolist()):
+            if quorum not in quorums:
+                quorums[quorum] = QuorumSchedule.from_grid(*quorum)
+            schedules.append(quorums[quorum])
+
+        horizon = self.horizon
+        if horizon is None:
+            horizon = 2 * int(grid_sizes.max())**2
+        horizon = -(-horizon // WORD_BITS) * WORD_BITS
+
+        pairs = neighbor_pairs(positions, self.communication_range)
+        bitmaps = slot_activity_bitmaps(schedules, offsets, horizon)
+        latencies = first_common_slots(bitmaps, pairs)
+
+        # Pairs without a common slot within the horizon are solved exactly
+        for k in np.flatnonzero(np.isnan(latencies)):
+            i, j = pairs[k]
+            slot = schedules[i].first_common_slot(schedules[j], offsets[i], offsets[j])
+            latencies[k] = np.nan if slot is None else slot
+
+        discovered = latencies[~np.isnan(latencies)]
+        return {
+            "grid_sizes": grid_sizes,
+            "pairs": pairs,
+            "latencies": latencies,
+            "duty_cycles": np.array([schedule.duty_cycle for schedule in schedules]),
+            "undiscovered_fraction": 1 - len(discovered) / len(pairs) if len(pairs) else 0.0,
+            "avg_latency": np.mean(discovered) if len(discovered) else np.nan,
+            "quantiles": dict(zip((0.5, 0.9, 0.99), np.quantile(discovered, (0.5, 0.9, 0.99))))
+                         if len(discovered) else {},
+            "network_discovery_time": np.max(latencies) if len(pairs) else 0.0,
+            "latency_histogram": np.bincount(discovered.astype(np.int64), minlength=horizon),
+        }
@@ -0,0 +1,142 @@
+"""Packed bitset representation of quorum schedules.
+
+A schedule is the set of awake slots of a device within one cycle of
+`cycle_length` slots, stored as a bitset in uint64 words: bit b of word w is
+slot 64 * w + b. A grid quorum of size N has a cycle of N^2 slots and is awake
+in one row and one column of the N x N grid of `lib.utils.initialize_quorum_grid`.
+"""
+import math
+
+import numpy as np
+
+WORD_BITS = 64
+
+
+def _pack(awake):
+    """Pack a boolean slot array into uint64 words, zero-padding the last word."""
+    padded = np.zeros(-(-len(awake) // WORD_BITS) * WORD_BITS, dtype=bool)
+    padded[:len(awake)] = awake
+    return np.packbits(padded, bitorder='little').view('<u8')
+
+
+class QuorumSchedule:
+    """
+    The awake slots of a device within one cycle, stored as a packed bitset.
+    """
+    __slots__ = ('cycle_length', 'words')
+
+    def __init__(self, cycle_length, words) -> None:
+        """This constructor wraps an existing bitset.
+
+        Args:
+            cycle_length (int): The number of slots in one cycle
+            words (array): The uint64 words of the bitset, see `from_slots`
+                and `from_grid` to build them
+        """
+        self.cycle_length = int(cycle_length)
+        self.words = np.asarray(words, dtype=np.uint64)
+
+    @classmethod
+    def from_slots(cls, cycle_length, slots):
+        """Build a schedule awake in the given slots of a cycle."""
+        awake = np.zeros(cycle_length, dtype=bool)
+        awake[np.asarray(slots, dtype=np.int64)] = True
+        return cls(cycle_length, _pack(awake))
+
+    @classmethod
+    def from_grid(cls, grid_size, row, column):
+        """Build the grid quorum awake in one row and one column of an N x N grid."""
+        slots = np.arange(grid_size * grid_size)
+        awake = (slots // grid_size == row) | (slots % grid_size == column)
+        return cls(grid_size * grid_size, _pack(awake))
+
+    def to_bool(self):
+        """Return the awake slots of one cycle as a boolean array."""
+        return np.unpackbits(self.words.view(np.uint8), bitorder='little')[:self.cycle_length].astype(bool)
+
+    def active_slots(self):
+        """Return the sorted indices of the awake slots of one cycle."""
+        return np.flatnonzero(self.to_bool())
+
+    def is_awake(self, slot):
+        """Check if the device is awake in `slot`, counted from the start of a cycle."""
+        slot = slot % self.cycle_length
+        return bool((self.words[slot // WORD_BITS] >> np.uint64(slot % WORD_BITS)) & np.uint64(1))
+
+    @property
+    def num_awake(self):
+        """The number of awake slots per cycle."""
+        return int(np.unpackbits(self.words.view(np.uint8)).sum())
+
+    @property
+    def duty_cycle(self):
+        """The fraction of awake slots, which the energy cost is proportional to."""
+        return self.num_awake / self.cycle_length
+
+    def rotated(self, offset):
+        """Return the schedule started `offset` slots into its cycle.
+
+        Slot t of the rotated schedule is slot (t + offset) mod cycle_length of
+        this schedule.
+        """
+        return QuorumSchedule(self.cycle_length, _pack(np.roll(self.to_bool(), -offset)))
+
+    def awake_slots(self, offset, horizon):
+        """Return the awake slots in [0, horizon) of the schedule started at `offset`."""
+        cycle = np.roll(self.to_bool(), -(offset % self.cycle_length))
+        return np.tile(cycle, -(-horizon // self.cycle_length))[:horizon]
+
+    def overlaps(self, other):
+        """Check if two schedules with the same cycle share an awake slot without offset."""
+        return bool(np.any(self.words & other.words))
+
+    def guarantees_overlap(self, other):
+        """
+        Check if the two schedules share an awake slot under every cyclic offset.
+
+        The combined pattern of two cycles repeats every lcm of their lengths.
+        By the Chinese remainder theorem, awake slots a and b coincide at some
+        time under offset d if and only if b - a = d modulo the gcd of the
+        lengths, so every offset is covered if the differences of the awake
+        slots reach all residues of the gcd.
+        """
+        gcd = math.gcd(self.cycle_length, other.cycle_length)
+        differences = np.subtract.outer(other.active_slots(), self.active_slots()) % gcd
+        return np.unique(differences).size == gcd
+
+    def first_common_slot(self, other, offset=0, other_offset=0):
+        """
+        Find the first slot in which both schedules are awake.
+
+        Args:
+            other (QuorumSchedule): The schedule of the other device
+            offset (int): The slot of its cycle this schedule starts in
+            other_offset (int): The slot of its cycle the other schedule starts in
+
+        Returns:
+            int: The first common slot t >= 0, or None if the schedules never overlap
+        """
+        if self.cycle_length == other.cycle_length:
+            common = self.rotated(offset).words & other.rotated(other_offset).words
+            nonzero = np.flatnonzero(common)
+            if nonzero.size == 0:
+                return None
+            word = int(common[nonzero[0]])
+            return int(nonzero[0]) * WORD_BITS + (word & -word).bit_length() - 1
+
+        # Solve t = a - offset (mod m) and t = b - other_offset (mod n) for all
+        # pairs of awake slots a and b; only pairs agreeing modulo the gcd have
+        # a solution, which is unique modulo the lcm.
+        m, n = self.cycle_length, other.cycle_length
+        gcd = math.gcd(m, n)
+        lcm = m // gcd * n
+        residues = (self.active_slots() - offset) % m
+        other_residues = (other.active_slots() - other_offset) % n
+        differences = np.subtract.outer(other_residues, residues)
+        b_index, a_index = np.nonzero(differences % gcd == 0)
+        if a_index.size == 0:
+            return None
+
+        inverse = pow(m // gcd, -1, n // gcd) if n // gcd > 1 else 0
+        steps = (differences[b_index, a_index] // gcd * inverse) % (n // gcd)
+        return int(np.min((residues[a_index] + m * steps) % lcm))
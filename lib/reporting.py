@@ -0,0 +1,57 @@
+"""Report sinks for `lib.ble_simulation.run_simulation`.
+
+A sink is any callable taking (params, result, summary): the simulated
+parameter point, the `DiscoveryAccumulator` of its trials and the summary
+returned by `run_simulation`.
+
+    run_simulation(2.0, 0.5, 0.5, sinks=[PlotSink(), CsvSink('latency.csv')])
+"""
+import csv
+import os
+
+import numpy as np
+
+from lib.ble_simulation import draw_latency_histogram
+
+
+class PlotSink:
+    """Draws the latency histogram and CDF of every simulated point."""
+    def __call__(self, params, result, summary):
+        draw_latency_histogram(result.latency_histogram, params["period"], params["beacon_duration"],
+                               params["rate"], summary["avg_latency"], result.latency.std)
+
+
+class CsvSink:
+    """Appends one row with the parameters and summary of every point to a CSV file."""
+    def __init__(self, path) -> None:
+        self.path = path
+
+    def __call__(self, params, result, summary):
+        row = {**params, **summary, "num_trials": result.count}
+        write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(row))
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+
+
+class SummarySink:
+    """Collects summary statistics of the latency of every point."""
+    def __init__(self, quantiles=(0.5, 0.9, 0.99), verbose=False) -> None:
+        self.quantiles = quantiles
+        self.verbose = verbose
+        self.rows = []
+
+    def __call__(self, params, result, summary):
+        quantiles = np.atleast_1d(result.latency_histogram.quantile(self.quantiles))
+        row = {
+            **params,
+            **summary,
+            "std_latency": result.latency.std,
+            **{f"p{q * 100:g}": value for q, value in zip(self.quantiles, quantiles)},
+            "max_beacon": len(result.beacon_histogram.counts),
+        }
+        self.rows.append(row)
+        if self.verbose:
+            print(', '.join(f'{key}={value:.4g}' for key, value in row.items() if value is not None))
@@ -0,0 +1,145 @@
+"""Parallel parameter sweeps of the discovery simulation.
+
+Every (period, beacon_duration, rate) point is simulated in a process pool
+with its own `np.random.SeedSequence` stream, derived from the sweep seed and
+the index of the point, so results do not depend on the number of workers or
+the order in which points finish. Rows are appended to a CSV file as soon as
+they are done and an interrupted sweep resumes by skipping the points that
+are already in the file. A file written by a sweep with other points, trial
+count or seed is rejected instead of being mixed with the new rows.
+
+Run a sweep from the repository root:
+
+    python -m lib.sweep --periods 1 2 5 --durations 0.1 0.5 --rates 0.1 0.5 1 --out sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from lib.ble_simulation import BatchSimulation, calculate_ci, num_simulations
+
+COLUMNS = ['index', 'period', 'beacon_duration', 'rate', 'num_trials', 'seed',
+           'avg_latency', 'std_latency', 'lower_ci', 'upper_ci', 'avg_energy_cost']
+
+
+def make_grid(periods, beacon_durations, rates):
+    """Return the list of all (period, beacon_duration, rate) combinations."""
+    return list(itertools.product(periods, beacon_durations, rates))
+
+
+def simulate_point(index, period, beacon_duration, rate, num_trials, seed):
+    """Simulate one point of a sweep with the random stream of its index.
+
+    Returns:
+        Dict with one row of the sweep table.
+    """
+    seed_sequence = np.random.SeedSequence(seed, spawn_key=(index,))
+    rng = np.random.default_rng(seed_sequence)
+
+    simulation = BatchSimulation(rate, beacon_duration, period)
+    latency_results, energy_cost_results, _ = simulation.run(num_trials, rng=rng)
+    lower_ci, upper_ci = calculate_ci(latency_results)
+
+    return {
+        "index": index,
+        "period": period,
+        "beacon_duration": beacon_duration,
+        "rate": rate,
+        "num_trials": num_trials,
+        "seed": seed,
+        "avg_latency": np.mean(latency_results),
+        "std_latency": np.std(latency_results),
+        "lower_ci": lower_ci,
+        "upper_ci": upper_ci,
+        "avg_energy_cost": np.mean(energy_cost_results),
+    }
+
+
+def task_key(period, beacon_duration, rate, num_trials, seed):
+    """The values that determine a row of the sweep table besides its index."""
+    return float(period), float(beacon_duration), float(rate), int(num_trials), int(seed)
+
+
+def read_completed(path):
+    """Return the task keys of the points already stored in the CSV file at `path`, by index."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as f:
+        return {int(row['index']): task_key(*(row[column] for column in COLUMNS[1:6]))
+                for row in csv.DictReader(f)}
+
+
+def run_sweep(points, path, num_trials=num_simulations, seed=0, max_workers=None, parquet_path=None):
+    """Simulate all `points` in a process pool and stream the results to `path`.
+
+    Args:
+        points (list): The (period, beacon_duration, rate) points, e.g. from `make_grid`.
+            The position of a point in the list selects its random stream, so a
+            resumed sweep must be given the same list.
+        path (str): The CSV file the rows are appended to.
+        num_trials (int): The number of simulation trials per point.
+        seed (int): The seed of the whole sweep.
+        max_workers (int, optional): The number of worker processes.
+        parquet_path (str, optional): Also write the complete table as Parquet
+            (requires pandas with a Parquet engine).
+
+    Returns:
+        List of all rows in the table, ordered by point index.
+
+    Raises:
+        ValueError: If `path` holds rows of a sweep with other points,
+            `num_trials` or `seed`.
+    """
+    completed = read_completed(path)
+    for index, stored in completed.items():
+        if index >= len(points) or stored != task_key(*points[index], num_trials, seed):
+            raise ValueError(f'{path} holds row {index} of another sweep, {stored}; '
+                             f'use another output file to run this one')
+    pending = [(index, point) for index, point in enumerate(points) if index not in completed]
+
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if write_header:
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(simulate_point, index, *point, num_trials, seed)
+                       for index, point in pending]
+            for future in as_completed(futures):
+                writer.writerow(future.result())
+                f.flush()
+
+    with open(path, newline='') as f:
+        rows = sorted(csv.DictReader(f), key=lambda row: int(row['index']))
+
+    if parquet_path is not None:
+        import pandas as pd
+        pd.read_csv(path).sort_values('index').to_parquet(parquet_path, index=False)
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--periods', type=float, nargs='+', required=True)
+    parser.add_argument('--durations', type=float, nargs='+', required=True)
+    parser.add_argument('--rates', type=float, nargs='+', required=True)
+    parser.add_argument('--out', required=True, help='CSV file the results are streamed to')
+    parser.add_argument('--parquet', help='Also write the table as Parquet')
+    parser.add_argument('--trials', type=int, default=num_simulations)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    points = make_grid(args.periods, args.durations, args.rates)
+    run_sweep(points, args.out, num_trials=args.trials, seed=args.seed,
+              max_workers=args.workers, parquet_path=args.parquet)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from lib.accumulators import BincountCounter, DiscoveryAccumulator, LatencyHistogram, RunningMoments
+
+
+def batches(seed=0, sizes=(1, 1000, 0, 37, 5000)):
+    rng = np.random.default_rng(seed)
+    return [rng.exponential(40.0, size) for size in sizes]
+
+
+def test_running_moments_match_numpy():
+    values = batches()
+    moments = RunningMoments()
+    for batch in values:
+        moments.update(batch)
+    data = np.concatenate(values)
+    assert moments.count == data.size
+    assert moments.mean == pytest.approx(np.mean(data), rel=1e-12)
+    assert moments.variance == pytest.approx(np.var(data), rel=1e-12)
+
+
+def test_running_moments_merge_matches_single_stream():
+    first, second = RunningMoments(), RunningMoments()
+    for batch in batches(1):
+        first.update(batch)
+    for batch in batches(2):
+        second.update(batch)
+    data = np.concatenate(batches(1) + batches(2))
+    merged = first.merge(second)
+    assert merged.mean == pytest.approx(np.mean(data), rel=1e-12)
+    assert merged.variance == pytest.approx(np.var(data), rel=1e-12)
+    assert RunningMoments().merge(RunningMoments()).count == 0
+
+
+def test_bincount_counter_matches_bincount():
+    rng = np.random.default_rng(0)
+    values = [rng.integers(0, size, 100) for size in (5, 50, 2)]
+    first, second = BincountCounter(), BincountCounter()
+    first.update(values[0])
+    second.update(values[1])
+    second.update(values[2])
+    np.testing.assert_array_equal(first.merge(second).counts, np.bincount(np.concatenate(values)))
+
+
+def test_latency_histogram_quantiles_within_bin_precision():
+    data = np.concatenate(batches())
+    histogram = LatencyHistogram(significant_bits=7)
+    for batch in batches():
+        histogram.update(batch)
+    q = np.array([0.01, 0.5, 0.9, 0.99, 0.999])
+    # Within a bin of the empirical quantile, which is at most 2**-7 of it wide
+    np.testing.assert_allclose(histogram.quantile(q), np.quantile(data, q), rtol=2 * 2**-7)
+    x = np.quantile(data, q)
+    np.testing.assert_allclose(histogram.cdf(x), q, atol=2e-3)
+
+
+def test_latency_histogram_merge_matches_single_stream():
+    first, second, single = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for batch in batches(1):
+        first.update(batch)
+        single.update(batch)
+    for batch in batches(2):
+        second.update(batch)
+        single.update(batch)
+    merged = first.merge(second)
+    np.testing.assert_array_equal(merged.counts, single.counts)
+    assert (merged.count, merged.min, merged.max) == (single.count, single.min, single.max)
+    with pytest.raises(ValueError):
+        merged.merge(LatencyHistogram(significant_bits=5))
+
+
+def test_discovery_accumulator_merge():
+    rng = np.random.default_rng(0)
+    trials = [(rng.exponential(10.0, size), rng.exponential(3.0, size), rng.integers(1, 20, size))
+              for size in (300, 700)]
+    first, second = DiscoveryAccumulator(), DiscoveryAccumulator()
+    first.update(*trials[0])
+    second.update(*trials[1])
+    merged = first.merge(second)
+
+    latencies, energy_costs, beacon_indices = (np.concatenate(values) for values in zip(*trials))
+    assert merged.count == 1000
+    assert merged.latency.mean == pytest.approx(np.mean(latencies), rel=1e-12)
+    assert merged.energy_cost.variance == pytest.approx(np.var(energy_costs), rel=1e-12)
+    np.testing.assert_array_equal(merged.beacon_histogram.counts, np.bincount(beacon_indices - 1))
+    assert merged.latency_histogram.count == 1000
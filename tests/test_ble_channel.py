@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+
+from lib.ble_channel import (ADVERTISING_CHANNELS, ChannelModel, advertising_packets, detect_collisions,
+                             periodic_collisions, simulate_channel_discovery)
+from lib.ble_scenario import Scenario
+
+
+def brute_force_collisions(starts, ends, channels):
+    """Check every pair of packets for an overlap on the same channel."""
+    collided = np.zeros(len(starts), dtype=bool)
+    for i in range(len(starts)):
+        for j in range(i + 1, len(starts)):
+            if channels[i] == channels[j] and starts[i] < ends[j] and starts[j] < ends[i]:
+                collided[i] = collided[j] = True
+    return collided
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_detect_collisions_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 10, 300)
+    ends = starts + rng.uniform(0, 0.1, starts.size)
+    channels = rng.choice(ADVERTISING_CHANNELS, starts.size)
+
+    expected = brute_force_collisions(starts, ends, channels)
+    assert 0 < expected.sum() < starts.size
+    np.testing.assert_array_equal(detect_collisions(starts, ends, channels), expected)
+    np.testing.assert_array_equal(detect_collisions(starts.tolist(), ends.tolist(), channels.tolist()), expected)
+
+
+def test_detect_collisions_of_advertising_packets_matches_brute_force():
+    rng = np.random.default_rng(5)
+    periods = rng.uniform(0.5, 1.5, 20)
+    packets = advertising_packets(periods, 0.06, rng.uniform(0, periods), until=10.0, max_delay=0.01, rng=rng)
+
+    expected = brute_force_collisions(packets["start"], packets["end"], packets["channel"])
+    assert expected.any()
+    np.testing.assert_array_equal(detect_collisions(packets["start"], packets["end"], packets["channel"]),
+                                  expected)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_periodic_collisions_match_sweep_line(seed):
+    rng = np.random.default_rng(seed)
+    periods = rng.uniform(0.5, 1.5, 30)
+    beacon_durations = rng.uniform(0.03, 0.09, periods.size)
+    offsets = rng.uniform(0, periods)
+    packets = advertising_packets(periods, beacon_durations, offsets, until=20.0, rng=rng)
+
+    num_channels = len(ADVERTISING_CHANNELS)
+    slots = np.tile(np.arange(num_channels), packets["start"].size // num_channels)
+    beacon_starts = packets["start"] - slots * beacon_durations[packets["device"]] / num_channels
+    expected = detect_collisions(packets["start"], packets["end"], packets["channel"])
+    assert expected.any()
+    np.testing.assert_array_equal(
+        periodic_collisions(packets["device"], beacon_starts, slots, periods, beacon_durations, offsets),
+        expected)
+
+
+@pytest.mark.parametrize("packet_error_rate", [0.05, 0.3])
+def test_packet_error_rate_per_channel(packet_error_rate):
+    rng = np.random.default_rng(0)
+    periods = np.full(50, 1.0)
+    packets = advertising_packets(periods, 0.02, rng.uniform(0, periods), until=500.0, rng=rng)
+    collided = detect_collisions(packets["start"], packets["end"], packets["channel"])
+    received = ChannelModel(packet_error_rate).received(packets, rng, collided=collided)
+
+    assert not np.any(received & collided)
+    for channel in ADVERTISING_CHANNELS:
+        intact = (packets["channel"] == channel) & ~collided
+        assert intact.sum() > 10000
+        # Five binomial standard errors
+        tolerance = 5 * np.sqrt(packet_error_rate * (1 - packet_error_rate) / intact.sum())
+        assert np.mean(~received[intact]) == pytest.approx(packet_error_rate, abs=tolerance)
+
+
+def test_scenario_without_channel_is_unchanged():
+    args = (np.full(5, 1.0), 0.2, [2.0, 3.0])
+    lossless = Scenario(*args, channel=None).run(rng=3)
+    np.testing.assert_array_equal(lossless["latencies"], Scenario(*args).run(rng=3)["latencies"])
+
+
+def test_scenario_loses_every_packet():
+    result = Scenario(np.full(5, 1.0), 0.2, [5.0], until=20.0, channel=ChannelModel(1.0)).run(rng=0)
+    assert result["undiscovered_fraction"] == 1
+
+
+@pytest.mark.parametrize("num_devices, packet_error_rate", [(5, 0.0), (30, 0.2)])
+def test_scenario_channel_matches_channel_simulation(num_devices, packet_error_rate):
+    period, beacon_duration, rate, until = 1.0, 0.15, 4.0, 10.0
+    rng = np.random.default_rng(1)
+    scenario = Scenario(np.full(num_devices, period), beacon_duration, [rate], until=until,
+                        channel=ChannelModel(packet_error_rate))
+    scenario_latencies = np.concatenate([scenario.run(rng=rng)["latencies"][0] for _ in range(100)])
+    channel_latencies = np.concatenate([
+        simulate_channel_discovery(num_devices, period, beacon_duration, rate, until,
+                                   packet_error_rate=packet_error_rate, rng=rng)["latencies"]
+        for _ in range(100)])
+
+    assert np.mean(np.isnan(scenario_latencies)) == pytest.approx(np.mean(np.isnan(channel_latencies)), abs=0.05)
+    assert ks_2samp(scenario_latencies[~np.isnan(scenario_latencies)],
+                    channel_latencies[~np.isnan(channel_latencies)]).pvalue > 1e-3
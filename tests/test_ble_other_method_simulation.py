@@ -0,0 +1,24 @@
+import random
+
+import numpy as np
+from scipy.stats import ks_2samp
+
+from lib.ble_other_method_simulation import (BLEOtherMethodSimulation, BatchBLEOtherMethodSimulation,
+                                             run_batch_simulation)
+
+
+def test_batch_matches_scalar_distribution():
+    random.seed(0)
+    simulation = BLEOtherMethodSimulation(1.0, adv_interval=0.1, adv_window=0.01)
+    scalar = [simulation.run() for _ in range(2000)]
+    batch = BatchBLEOtherMethodSimulation(1.0, adv_interval=0.1, adv_window=0.01).run(
+        20000, rng=np.random.default_rng(0))
+    assert ks_2samp(scalar, batch).pvalue > 1e-3
+
+
+def test_batch_accepts_int_seed():
+    simulation = BatchBLEOtherMethodSimulation(1.0, adv_interval=0.1, adv_window=0.01)
+    np.testing.assert_array_equal(simulation.run(100, rng=1), simulation.run(100, rng=1))
+    assert run_batch_simulation(1.0, 0.1, 0.01, num_trials=100, rng=1) == \
+        run_batch_simulation(1.0, 0.1, 0.01, num_trials=100, rng=1)
+    assert simulation.run(100).shape == (100,)
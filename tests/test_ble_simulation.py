@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+
+from lib.accumulators import DiscoveryAccumulator
+from lib.ble_simulation import (BatchSimulation, Simulation, accumulate_discovery, advance_beacon,
+                                energy_cost_of_beacon, energy_cost_of_scanning, find_beacon)
+
+POINTS = [(2.0, 0.5, 0.5), (1.0, 1.9, 1.0), (1.0, 1.0, 0.2), (0.5, 1.2, 0.8), (10.0, 0.1, 0.1)]
+
+
+def reference_run(rate, beacon_duration, beacon_period):
+    """The beacon-advance loop `Simulation.run` replaced."""
+    y_k, n_i, num_scans = 0, 1, 0
+    while True:
+        y_k += np.random.exponential(scale=1 / rate)
+        num_scans += 1
+        while y_k > n_i * beacon_period + beacon_duration / 2:
+            n_i += 1
+        if n_i * beacon_period - beacon_duration / 2 <= y_k:
+            energy = n_i * energy_cost_of_beacon * beacon_duration + num_scans * energy_cost_of_scanning
+            return y_k, energy, n_i
+
+
+def reference_find_beacon(y_k, beacon_period, beacon_duration):
+    n = 1
+    while y_k > n * beacon_period + beacon_duration / 2:
+        n += 1
+    return n, y_k >= n * beacon_period - beacon_duration / 2
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", POINTS)
+def test_find_beacon_matches_loop(period, beacon_duration, rate):
+    scans = np.cumsum(np.random.default_rng(0).exponential(1 / rate, 500))
+    expected = [reference_find_beacon(y_k, period, beacon_duration) for y_k in scans]
+
+    assert [find_beacon(float(y_k), period, beacon_duration) for y_k in scans] == expected
+    n, discovered = find_beacon(scans, period, beacon_duration)
+    assert list(zip(n.astype(int).tolist(), discovered.tolist())) == expected
+
+    n_i, advanced = 1, []
+    for y_k in scans.tolist():
+        n_i, discovered = advance_beacon(y_k, period, beacon_duration, n_i)
+        advanced.append((n_i, discovered))
+    assert advanced == expected
+
+
+@pytest.mark.parametrize("y_k", [3, 3.0, np.float32(3.0), np.float64(3.0), np.array(3.0)])
+def test_find_beacon_accepts_scalars(y_k):
+    n, discovered = find_beacon(y_k, 2.0, 0.5)
+    assert (n, bool(discovered)) == (2, False)
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", POINTS)
+def test_simulation_matches_reference_loop(period, beacon_duration, rate):
+    simulation = Simulation(rate, beacon_duration, period)
+    for seed in range(50):
+        np.random.seed(seed)
+        expected = reference_run(rate, beacon_duration, period)
+        np.random.seed(seed)
+        histogram = np.zeros(10**5)
+        latency, energy = simulation.run(histogram, include_energy_cost=True)
+        assert (latency, energy) == expected[:2]
+        assert histogram[expected[2] - 1] == 1
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", POINTS)
+def test_batch_simulation_matches_scalar_distribution(period, beacon_duration, rate):
+    np.random.seed(0)
+    scalar = np.array([reference_run(rate, beacon_duration, period) for _ in range(2000)])
+    latencies, energy_costs, beacon_indices = BatchSimulation(rate, beacon_duration, period).run(
+        20000, rng=np.random.default_rng(0))
+
+    assert ks_2samp(scalar[:, 0], latencies).pvalue > 1e-3
+    assert ks_2samp(scalar[:, 1], energy_costs).pvalue > 1e-3
+    assert ks_2samp(scalar[:, 2], beacon_indices).pvalue > 1e-3
+
+
+def test_batch_simulation_mixes_parameter_points():
+    period, beacon_duration, rate = (np.array(values) for values in zip(*POINTS))
+    rng = np.random.default_rng(0)
+    latencies, _, beacon_indices = BatchSimulation(np.repeat(rate, 4000), np.repeat(beacon_duration, 4000),
+                                                   np.repeat(period, 4000)).run(len(POINTS) * 4000, rng=rng)
+    for i, (L, omega, lambda_) in enumerate(POINTS):
+        expected, _, expected_indices = BatchSimulation(lambda_, omega, L).run(4000, rng=rng)
+        assert ks_2samp(latencies[i * 4000:(i + 1) * 4000], expected).pvalue > 1e-3
+        n, discovered = find_beacon(latencies[i * 4000:(i + 1) * 4000], L, omega)
+        np.testing.assert_array_equal(n, beacon_indices[i * 4000:(i + 1) * 4000])
+        assert discovered.all()
+
+
+def test_accumulated_batches_match_one_batch():
+    latencies, energy_costs, beacon_indices = BatchSimulation(0.5, 0.5, 2.0).run(
+        10000, rng=np.random.default_rng(3))
+    result = accumulate_discovery(2.0, 0.5, 0.5, num_trials=10000, rng=np.random.default_rng(3),
+                                  batch_size=10000)
+    expected = DiscoveryAccumulator()
+    expected.update(latencies, energy_costs, beacon_indices)
+
+    assert result.latency.mean == expected.latency.mean
+    assert result.energy_cost.variance == expected.energy_cost.variance
+    np.testing.assert_array_equal(result.beacon_histogram.counts, np.bincount(beacon_indices - 1))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from scipy.stats import bootstrap
+
+from lib.bootstrap import bootstrap_ci, bootstrap_means, poisson_bootstrap_ci
+
+DATA = np.random.default_rng(0).exponential(40.0, 500)
+
+
+def test_bootstrap_means_match_resampling_loop():
+    rng = np.random.default_rng(1)
+    expected = [np.mean(DATA[rng.integers(0, len(DATA), size=len(DATA), dtype=np.int32)]) for _ in range(300)]
+    means = bootstrap_means(DATA, 300, rng=np.random.default_rng(1))
+    np.testing.assert_allclose(means, expected, rtol=1e-12)
+
+
+def test_bootstrap_means_do_not_depend_on_the_chunks():
+    np.testing.assert_array_equal(bootstrap_means(DATA, 300, rng=2, max_chunk_elements=len(DATA) * 7),
+                                  bootstrap_means(DATA, 300, rng=2))
+
+
+@pytest.mark.parametrize("method", ["percentile", "bca"])
+def test_bootstrap_ci_matches_scipy(method):
+    lower, upper = bootstrap_ci(DATA, num_resamples=20000, method=method, rng=3)
+    expected = bootstrap((DATA,), np.mean, n_resamples=20000, method='BCa' if method == 'bca' else method,
+                         random_state=4).confidence_interval
+    width = expected.high - expected.low
+    assert lower == pytest.approx(expected.low, abs=0.05 * width)
+    assert upper == pytest.approx(expected.high, abs=0.05 * width)
+
+
+def test_poisson_bootstrap_matches_bootstrap():
+    lower, upper = poisson_bootstrap_ci(np.array_split(DATA, 7), num_resamples=20000, rng=5)
+    expected_lower, expected_upper = bootstrap_ci(DATA, num_resamples=20000, rng=6)
+    width = expected_upper - expected_lower
+    assert lower == pytest.approx(expected_lower, abs=0.05 * width)
+    assert upper == pytest.approx(expected_upper, abs=0.05 * width)
+
+
+def test_bootstrap_ci_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        bootstrap_ci(DATA, method='basic')
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from lib.ble_simulation import BatchSimulation
+from lib.importance_sampling import (approximate_quantile, conditional_tail_probability, effective_sample_size,
+                                     importance_sampling_tail, likelihood_ratios, weighted_quantile,
+                                     weighted_tail_probability)
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", [(1.0, 1.9, 1.0), (2.0, 2.0, 0.6), (1.0, 3.0, 0.5)])
+def test_overlapping_windows_quantile_is_exact(period, beacon_duration, rate):
+    # Overlapping windows cover all the time from the first window start on
+    start = max(period - beacon_duration / 2, 0)
+    threshold = approximate_quantile(period, beacon_duration, rate, 0.999)
+    assert np.exp(-rate * (threshold - start)) == pytest.approx(1e-3)
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", [(1.0, 1.9, 1.0), (2.0, 2.0, 0.6)])
+def test_tail_of_overlapping_windows(period, beacon_duration, rate):
+    result = importance_sampling_tail(period, beacon_duration, rate, num_trials=20000,
+                                      rng=np.random.default_rng(0))
+    start = max(period - beacon_duration / 2, 0)
+    exact = np.exp(-rate * (result["threshold"] - start))
+    assert abs(result["tail_probability"] - exact) < 4 * result["standard_error"]
+
+
+def exact_tail_probability(period, beacon_duration, rate, threshold, max_beacons=100000):
+    """P(T > threshold) for separate windows, summed over the discovering beacon."""
+    hit_probability = -np.expm1(-rate * beacon_duration)
+    n = np.arange(1, max_beacons + 1)
+    elapsed = np.clip(threshold - (n * period - beacon_duration / 2), 0, beacon_duration)
+    conditional_tail = (np.exp(-rate * elapsed) - np.exp(-rate * beacon_duration)) / hit_probability
+    return np.sum(hit_probability * (1 - hit_probability)**(n - 1) * conditional_tail)
+
+
+@pytest.mark.parametrize("period, beacon_duration, rate", [(2.0, 0.5, 0.5), (10.0, 0.1, 0.1), (1.0, 0.05, 0.3)])
+def test_tail_estimators_match_exact_tail(period, beacon_duration, rate):
+    threshold = approximate_quantile(period, beacon_duration, rate, 0.999)
+    exact = exact_tail_probability(period, beacon_duration, rate, threshold)
+
+    result = importance_sampling_tail(period, beacon_duration, rate, num_trials=20000,
+                                      rng=np.random.default_rng(1))
+    assert abs(result["tail_probability"] - exact) < 4 * result["standard_error"]
+    assert result["effective_sample_size"] > 1000
+
+    conditional = conditional_tail_probability(period, beacon_duration, rate, threshold, num_trials=20000,
+                                               rng=np.random.default_rng(2))
+    assert abs(conditional["tail_probability"] - exact) < 4 * conditional["standard_error"]
+
+
+def test_untilted_weights_reduce_to_plain_monte_carlo():
+    latencies, _, _ = BatchSimulation(0.5, 0.5, 2.0).run(5000, rng=np.random.default_rng(3))
+    weights = likelihood_ratios(latencies, 2.0, 0.5, 0.5, 0.5)
+    np.testing.assert_allclose(weights, 1.0)
+    assert effective_sample_size(weights) == pytest.approx(5000)
+    probability, _ = weighted_tail_probability(latencies, weights, 20.0)
+    assert probability == pytest.approx(np.mean(latencies > 20.0))
+    # The smallest latency with at most 10% of the trials above it
+    quantile = weighted_quantile(latencies, weights, 0.9)
+    sorted_latencies = np.sort(latencies)
+    assert quantile in sorted_latencies[[4499, 4500]]
+    assert np.mean(latencies > quantile) <= 0.1
+
+
+def test_conditional_estimator_rejects_overlapping_windows():
+    with pytest.raises(ValueError):
+        conditional_tail_probability(1.0, 1.9, 1.0, 5.0)
@@ -0,0 +1,29 @@
+from lib.latency_oracle import LatencyOracle
+
+
+def test_oracle_quantizes_and_caches():
+    calls = []
+
+    def compute(omega, L, lambda_):
+        calls.append((omega, L, lambda_))
+        return {"latency": L / (omega * lambda_)}
+
+    oracle = LatencyOracle(compute, quantum=1e-3)
+    assert oracle(0.5, 2.0, 0.5) == oracle(0.5001, 2.0, 0.4999)
+    assert len(calls) == 1
+    assert oracle.cache_info()["hits"] == 1
+
+
+def test_oracle_store_is_shared(tmp_path):
+    path = str(tmp_path / "oracle")
+    first = LatencyOracle(lambda omega, L, lambda_: {"latency": L}, path=path, namespace='a:')
+    second = LatencyOracle(lambda omega, L, lambda_: {"latency": -1.0}, path=path, namespace='a:')
+    other = LatencyOracle(lambda omega, L, lambda_: {"latency": -2.0}, path=path, namespace='b:')
+
+    assert first(0.5, 2.0, 0.5) == {"latency": 2.0}
+    # Written by the first oracle before the second one looks it up
+    assert second(0.5, 2.0, 0.5) == {"latency": 2.0}
+    assert second.cache_info()["disk_hits"] == 1
+    assert other(0.5, 2.0, 0.5) == {"latency": -2.0}
+    for oracle in (first, second, other):
+        oracle.close()
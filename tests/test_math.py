@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from scipy.special import gammainc
+
+from lib.math import (ErlangTableCache, adaptive_beacon_match_probabilities, adaptive_latency_result,
+                      analytical_latency_result, beacon_match_probabilities,
+                      probability_of_matching_with_beacon_n, summed_erlang_k_cdf)
+
+
+@pytest.mark.parametrize("k_limit", [0, 1, 2, 7, 100])
+def test_summed_erlang_k_cdf_matches_sum(k_limit):
+    t = np.array([0.0, 0.3, 2.0, 40.0, 300.0])
+    expected = sum(gammainc(k, 0.5 * t) for k in range(1, k_limit + 1)) if k_limit else np.zeros_like(t)
+    np.testing.assert_allclose(summed_erlang_k_cdf(k_limit, 0.5, t), expected, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(summed_erlang_k_cdf(np.full(t.shape, k_limit), 0.5, t), expected,
+                               rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("params", [(2.0, 0.5, 0.5), (1.0, 1.9, 1.0), (10.0, 0.1, 0.1)])
+def test_beacon_match_probabilities_match_k_sum(params):
+    interval, omega, rate = params
+    expected = [probability_of_matching_with_beacon_n(30, interval, omega, rate, n) for n in range(1, 41)]
+    np.testing.assert_allclose(beacon_match_probabilities(interval, omega, rate, 40, 30), expected,
+                               rtol=1e-9, atol=1e-14)
+
+
+@pytest.mark.parametrize("params", [(2.0, 0.5, 0.5), (1.0, 1.9, 1.0), (10.0, 0.1, 0.1), (1.0, 0.01, 0.01)])
+def test_adaptive_match_probabilities_match_full_k_sum(params):
+    interval, omega, rate = params
+    n = np.array([1, 2, 10, 100, 1000])
+    P_n, k_error, _ = adaptive_beacon_match_probabilities(interval, omega, rate, n, tol=1e-12)
+    expected = [probability_of_matching_with_beacon_n(3000, interval, omega, rate, i) for i in n]
+    np.testing.assert_allclose(P_n, expected, rtol=1e-8, atol=1e-13)
+    assert np.all(k_error < 1e-10)
+
+
+def test_vectorized_latency_matches_points():
+    L, omega, rate = np.meshgrid([1.0, 4.0, 10.0], [0.1, 0.9, 1.9], [0.1, 0.5, 1.0], indexing='ij')
+    latency = analytical_latency_result((L, omega, rate), 100, 100)
+    expected = [analytical_latency_result(point, 100, 100) for point in zip(L.ravel(), omega.ravel(), rate.ravel())]
+    np.testing.assert_allclose(latency.ravel(), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("params", [
+    (2.0, 0.5, 0.5),
+    (5.0, 1.0, 0.3),
+    (10.0, 0.1, 0.1),
+    (2.0, 0.01, 0.5),
+    # lambda * omega > 1
+    (10.0, 1.9, 1.0),
+    (1.0, 1.9, 1.0),
+    (2.0, 2.0, 0.6),
+])
+def test_latency_tail_matches_adaptive(params):
+    expected = adaptive_latency_result(params, tol=1e-10)["latency"]
+    latency = analytical_latency_result(params, 100, 100, include_tail=True)
+    assert latency == pytest.approx(expected, rel=1e-3)
+
+
+def test_latency_tail_is_vectorized():
+    L = np.array([2.0, 10.0, 1.0])
+    omega = np.array([0.5, 1.9, 1.9])
+    rate = np.array([0.5, 1.0, 1.0])
+    latency = analytical_latency_result((L, omega, rate), 100, 100, include_tail=True)
+    expected = [analytical_latency_result(point, 100, 100, include_tail=True) for point in zip(L, omega, rate)]
+    np.testing.assert_allclose(latency, expected)
+
+
+def test_erlang_table_cache_matches_uncached():
+    cache = ErlangTableCache()
+    for params in [(2.0, 0.5, 0.5), (10.0, 1.9, 1.0), (2.0, 0.5, 0.5)]:
+        assert analytical_latency_result(params, 100, 100, cache=cache) == \
+            analytical_latency_result(params, 100, 100)
+    assert cache.cache_info()["hits"] == 1
+
+
+def test_erlang_table_cache_shares_quantized_keys():
+    cache = ErlangTableCache()
+    first = cache.beacon_match_probabilities(0.1 + 0.2, 0.5, 0.5, 10, 10)
+    assert cache.beacon_match_probabilities(0.3, 0.5, 0.5, 10, 10) is first
+    with pytest.raises(ValueError):
+        first[0] = 1.0
+
+
+@pytest.mark.parametrize("tol, max_n", [(1.0, 100000), (0.0, 100000), (1e-8, 0)])
+def test_adaptive_latency_rejects_empty_truncation(tol, max_n):
+    with pytest.raises(ValueError):
+        adaptive_latency_result((2.0, 0.5, 0.5), tol=tol, max_n=max_n)
+
+
+def test_adaptive_latency_with_one_beacon():
+    result = adaptive_latency_result((2.0, 0.5, 0.5), max_n=1)
+    assert result["n_limit"] == 1
+    # P_1 summed over all k is lambda * omega
+    assert result["latency"] == pytest.approx(2.0 * 0.5 * 0.5, rel=1e-6)
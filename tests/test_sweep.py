@@ -0,0 +1,27 @@
+import pytest
+
+from lib.sweep import make_grid, run_sweep
+
+
+def test_resumed_sweep_matches_single_run(tmp_path):
+    points = make_grid([1.0, 2.0], [0.5], [0.5, 1.0])
+    single = run_sweep(points, str(tmp_path / "single.csv"), num_trials=1000, seed=3, max_workers=2)
+
+    path = str(tmp_path / "resumed.csv")
+    run_sweep(points[:2], path, num_trials=1000, seed=3, max_workers=2)
+    resumed = run_sweep(points, path, num_trials=1000, seed=3, max_workers=2)
+    assert resumed == single
+
+
+@pytest.mark.parametrize("change", [
+    {"points": make_grid([1.0, 3.0], [0.5], [0.5, 1.0])},
+    {"num_trials": 2000},
+    {"seed": 4},
+])
+def test_resume_rejects_another_sweep(tmp_path, change):
+    path = str(tmp_path / "sweep.csv")
+    run_sweep(make_grid([1.0, 2.0], [0.5], [0.5, 1.0]), path, num_trials=1000, seed=3, max_workers=1)
+    arguments = {"points": make_grid([1.0, 2.0], [0.5], [0.5, 1.0]), "num_trials": 1000, "seed": 3}
+    arguments.update(change)
+    with pytest.raises(ValueError):
+        run_sweep(arguments.pop("points"), path, max_workers=1, **arguments)